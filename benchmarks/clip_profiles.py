@@ -0,0 +1,52 @@
+"""
+Report clip sizes and encode times for each clip profile.
+Run from the repository root with `python -m benchmarks.clip_profiles`
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from prettytable import PrettyTable
+from heardle_telegram.process_song import ClipGenerator
+from benchmarks.synthetic import write_song
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(
+        description="Compare clip profiles",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        add_help=True
+    )
+    arg_parser.add_argument("--input", help="MP3 to clip (default: a synthetic song)")
+    arg_parser.add_argument("--uplink-kbps", type=int, default=1000, help="Upload bandwidth for estimated send times")
+    return arg_parser.parse_args()
+
+if __name__ == '__main__':
+    options = parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = options.input
+        if source is None:
+            source = os.path.join(tmp_dir, 'synthetic.mp3')
+            write_song(source)
+        report = PrettyTable()
+        report.field_names = ["Profile", "Clip", "Bytes", "Encode (ms)", "Upload (ms)"]
+        for profile in ClipGenerator.clip_profiles:
+            clip_generator = ClipGenerator(os.path.join(tmp_dir, profile), profile=profile)
+            shutil.copy(source, clip_generator.full_song)
+            clip_generator.generate_clips()
+            leading_silence_end = clip_generator.find_leading_silence()
+            total_bytes = 0
+            for clip_num, duration in enumerate(clip_generator.clip_durations):
+                # Encode each clip on its own to time it
+                start_time = time.perf_counter()
+                clip_generator.encode_clips(leading_silence_end, [clip_num])
+                encode_ms = (time.perf_counter() - start_time) * 1000
+                size = os.path.getsize(clip_generator.get_clip_file(clip_num))
+                total_bytes += size
+                report.add_row([profile, f"{duration}s", size, f"{encode_ms:.0f}", f"{size * 8 / options.uplink_kbps:.0f}"])
+            report.add_row([
+                profile, "all", total_bytes,
+                f"{clip_generator.stage_times['encode'] * 1000:.0f}",
+                f"{total_bytes * 8 / options.uplink_kbps:.0f}"
+            ], divider=True)
+        print(report)
@@ -0,0 +1,189 @@
+"""
+Local stand-in for the Telegram Bot API, for load tests.
+Run it on its own with `python -m benchmarks.fake_bot_api`, and point the bot at it
+with "api_base_url": "http://127.0.0.1:8081/bot" in its Telegram config
+"""
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+from urllib.parse import parse_qsl, urlparse
+
+class FakeBotAPI:
+    """
+    Answers Bot API calls after a configurable delay, queues updates for getUpdates,
+    and tells listeners about every call so a harness can see what the bot sent
+    """
+    bot_user = {'id': 1, 'is_bot': True, 'first_name': "Heardle", 'username': "heardle_bot"}
+    # Longest a getUpdates call is held open waiting for updates
+    max_poll_timeout = 10
+
+    def __init__(self, port=8081, host='127.0.0.1', latency=0.05, jitter=0.02, seed=0) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.updates: list[dict] = []
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.condition = threading.Condition()
+        self.listeners: list[Callable[[str, dict, float], None]] = []
+        self.calls: Counter[str] = Counter()
+        api = self
+
+        class BotAPIHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(handler):
+                handler.respond(handler.read_params())
+
+            def do_GET(handler):
+                handler.respond(dict(parse_qsl(urlparse(handler.path).query)))
+
+            def read_params(handler) -> dict:
+                body = handler.rfile.read(int(handler.headers.get('Content-Length', 0)))
+                content_type = handler.headers.get('Content-Type', '')
+                if content_type.startswith('application/json'):
+                    return json.loads(body or b'{}')
+                if content_type.startswith('multipart/form-data'):
+                    message = BytesParser(policy=policy.HTTP).parsebytes(
+                        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+                    )
+                    params = {}
+                    for part in message.iter_parts():
+                        name = part.get_param('name', header='content-disposition')
+                        # Uploaded files are only counted, not kept
+                        params[name] = len(part.get_payload(decode=True)) if part.get_filename() else part.get_content()
+                    return params
+                return dict(parse_qsl(body.decode()))
+
+            def respond(handler, params: dict) -> None:
+                method = handler.path.split('?')[0].rsplit('/', 1)[-1]
+                result = api.call(method, params)
+                body = json.dumps({'ok': True, 'result': result}).encode()
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'application/json')
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), BotAPIHandler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    def get_base_url(self) -> str:
+        """Get the api_base_url the bot should use"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def add_listener(self, listener: Callable[[str, dict, float], None]) -> None:
+        """Call `listener(method, params, time)` after answering each call"""
+        self.listeners.append(listener)
+
+    def push_update(self, update: dict) -> int:
+        """Queue an update for getUpdates, returning its update_id"""
+        with self.condition:
+            update_id = self.next_update_id
+            self.next_update_id += 1
+            self.updates.append({'update_id': update_id, **update})
+            self.condition.notify_all()
+        return update_id
+
+    def get_updates(self, params: dict) -> list[dict]:
+        """Long-poll for queued updates from `offset` on"""
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        deadline = time.monotonic() + min(float(params.get('timeout') or 0), self.max_poll_timeout)
+        with self.condition:
+            self.updates = [update for update in self.updates if update['update_id'] >= offset]
+            while not self.updates and time.monotonic() < deadline:
+                self.condition.wait(deadline - time.monotonic())
+            return self.updates[:limit]
+
+    def make_message(self, params: dict, **content) -> dict:
+        """Make the Message a send method returns"""
+        with self.condition:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+            'from': self.bot_user,
+            **content
+        }
+
+    def call(self, method: str, params: dict):
+        """Answer one Bot API call"""
+        self.calls[method] += 1
+        if method == 'getUpdates':
+            return self.get_updates(params)
+        time.sleep(max(0.0, self.rng.gauss(self.latency, self.jitter)))
+        if method == 'getMe':
+            result = self.bot_user
+        elif method == 'sendMessage':
+            result = self.make_message(params, text=params.get('text', ''))
+        elif method in ('sendAudio', 'sendVoice'):
+            kind = 'audio' if method == 'sendAudio' else 'voice'
+            attachment = params.get(kind)
+            # A new upload gets a new file_id; a file_id is sent back as it is
+            file_id = attachment if isinstance(attachment, str) else f"file{self.next_message_id}"
+            result = self.make_message(
+                params,
+                caption=params.get('caption', ''),
+                **{kind: {'file_id': file_id, 'file_unique_id': file_id, 'duration': 1}}
+            )
+        elif method == 'deleteWebhook' and str(params.get('drop_pending_updates')).lower() == 'true':
+            with self.condition:
+                self.updates = []
+            result = True
+        else:
+            # answerInlineQuery, answerCallbackQuery, setWebhook, ...
+            result = True
+        now = time.perf_counter()
+        for listener in self.listeners:
+            listener(method, params, now)
+        return result
+
+    def start(self) -> None:
+        """Serve in a background thread"""
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-bot-api", daemon=True)
+        self.thread.start()
+        logging.info(f"Fake Bot API listening at {self.get_base_url()}")
+
+    def stop(self) -> None:
+        """Stop serving"""
+        self.server.shutdown()
+        self.server.server_close()
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(
+        description="Serve a stand-in Telegram Bot API",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        add_help=True
+    )
+    arg_parser.add_argument("--port", type=int, default=8081, help="Port to listen on")
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="Mean delay before answering a call, in seconds")
+    arg_parser.add_argument("--jitter", type=float, default=0.02, help="Standard deviation of the delay, in seconds")
+    return arg_parser.parse_args()
+
+if __name__ == '__main__':
+    logging.basicConfig(format='[%(asctime)s][%(levelname)s] %(message)s', level=logging.INFO)
+    options = parse_args()
+    api = FakeBotAPI(options.port, latency=options.latency, jitter=options.jitter)
+    api.start()
+    try:
+        while True:
+            time.sleep(60)
+            logging.info(f"Calls so far: {dict(api.calls)}")
+    except KeyboardInterrupt:
+        api.stop()
@@ -0,0 +1,60 @@
+"""
+Measure library load time and memory on a synthetic library.
+Run from the repository root with `python -m benchmarks.library_load`
+"""
+import argparse
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from heardle_telegram.ytmusic_library import Library
+from heardle_telegram.process_song import Song
+from benchmarks.synthetic import write_library_cache
+
+class DictSong:
+    """The original Song layout, with a __dict__ and an eagerly built URL"""
+    def __init__(self, song_info: dict):
+        self.title = song_info['title']
+        self.artist = song_info['artists'][0]['name']
+        self.id = song_info['videoId']
+        self.url = f"https://music.youtube.com/watch?v={self.id}"
+
+def measure(load) -> tuple[float, float, float]:
+    """Time a load and get its retained and peak traced memory in MB"""
+    gc.collect()
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    result = load()
+    elapsed = time.perf_counter() - start_time
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, current / 2**20, peak / 2**20
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark library loading",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        add_help=True
+    )
+    arg_parser.add_argument("--songs", type=int, default=100000, help="Number of synthetic songs")
+    return arg_parser.parse_args()
+
+if __name__ == '__main__':
+    options = parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = os.path.join(tmp_dir, 'library_cache')
+        write_library_cache(cache, options.songs)
+        def load_songs(song_class):
+            with open(cache) as cache_fh:
+                return {entry['videoId']: song_class(entry) for entry in map(json.loads, cache_fh)}
+        print(f"{options.songs} songs (time in s, memory in MB)")
+        for name, load in [
+            ("dict Song", lambda: load_songs(DictSong)),
+            ("slots Song", lambda: load_songs(Song)),
+            ("Library", lambda: Library(cache=cache))
+        ]:
+            elapsed, current, peak = measure(load)
+            print(f"{name:>12}: load {elapsed:.2f}, retained {current:.1f}, peak {peak:.1f}")
@@ -0,0 +1,83 @@
+"""
+Run library syncs against a stand-in YTMusic and check the cache after each:
+a full sync interrupted partway, its resume, a sync of new songs only, a
+full sync after songs were removed, and a full sync through YTMusicPager's
+fallback to get_library_songs. Reports the requests each step made.
+Run from the repository root with `python -m benchmarks.library_sync --songs 10000`
+"""
+import argparse
+import json
+import math
+import os
+import tempfile
+from prettytable import PrettyTable
+from heardle_telegram.library_sync import LibrarySync, YTMusicPager
+from benchmarks.synthetic import FakeYTMusic, make_library
+
+def read_cache_ids(cache: str) -> list[str]:
+    """Get the videoIds in the cache, in order"""
+    with open(cache) as cache_fh:
+        return [json.loads(line)['videoId'] for line in cache_fh]
+
+def check(step: str, cache: str, expected: list[dict]) -> None:
+    """Fail if the cache doesn't hold exactly the expected songs, in order"""
+    if read_cache_ids(cache) != [song['videoId'] for song in expected]:
+        raise SystemExit(f"{step}: cache doesn't match the library")
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(
+        description="Check interrupted, resumed, additions-only and full library syncs",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        add_help=True
+    )
+    arg_parser.add_argument("--songs", type=int, default=10000, help="Number of synthetic songs in the library")
+    arg_parser.add_argument("--interrupt-at", type=float, default=0.5, help="Fraction of the first sync's pages fetched before it fails")
+    arg_parser.add_argument("--added", type=int, default=60, help="Songs added to the library before the additions sync")
+    arg_parser.add_argument("--removed", type=int, default=40, help="Songs removed from the library before the last full sync")
+    return arg_parser.parse_args()
+
+if __name__ == '__main__':
+    options = parse_args()
+    library = make_library(options.songs + options.added)
+    songs, new_songs = library[:options.songs], library[options.songs:]
+    report = PrettyTable()
+    report.field_names = ["Step", "Requests", "Pages needed", "Added", "Removed", "Cache songs"]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = os.path.join(tmp_dir, 'library_cache')
+        library_sync = LibrarySync(cache)
+        pages = math.ceil(len(songs) / FakeYTMusic.page_size)
+
+        interrupted_at = int(pages * options.interrupt_at)
+        pager = FakeYTMusic(songs, fail_after=interrupted_at)
+        try:
+            library_sync.sync(pager)
+            raise SystemExit("Interrupted sync didn't fail")
+        except ConnectionError:
+            pass
+        report.add_row(["Interrupted sync", pager.requests - 1, interrupted_at, "-", "-", "-"])
+
+        pager = FakeYTMusic(songs)
+        added, removed = library_sync.sync(pager)
+        check("Resumed sync", cache, songs)
+        report.add_row(["Resumed sync", pager.requests, pages - interrupted_at, added, removed, len(songs)])
+
+        # New songs come first when ordered by recently added
+        songs = songs + new_songs
+        pager = FakeYTMusic(songs)
+        added, removed = library_sync.sync_additions(pager)
+        check("Additions sync", cache, songs)
+        report.add_row(["Additions sync", pager.requests, len(new_songs) // FakeYTMusic.page_size + 1, added, removed, len(songs)])
+
+        songs = songs[options.removed:]
+        pager = FakeYTMusic(songs)
+        added, removed = library_sync.sync(pager)
+        check("Full sync", cache, songs)
+        report.add_row(["Full sync", pager.requests, math.ceil(len(songs) / FakeYTMusic.page_size), added, removed, len(songs)])
+
+        # The stand-in has none of the ytmusicapi internals YTMusicPager pages with, as if they had moved
+        songs = songs[options.removed:] + make_library(options.added, seed=1)
+        fake = FakeYTMusic(songs)
+        added, removed = library_sync.sync(YTMusicPager(fake))
+        check("Fallback sync", cache, songs)
+        report.add_row(["Fallback sync", fake.requests, math.ceil(len(songs) / FakeYTMusic.page_size), added, removed, len(songs)])
+    print(report)
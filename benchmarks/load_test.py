@@ -0,0 +1,263 @@
+"""
+Load-test the bot with simulated players.
+Starts a stand-in Bot API, runs heardle-telegram.py against it with a synthetic
+library and song, and has each player start the game, listen, type guesses
+into inline queries, pass and guess like a person would. Reports response
+latency percentiles and throughput.
+Run from the repository root with `python -m benchmarks.load_test --players 1000`
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from prettytable import PrettyTable
+from heardle_telegram.process_song import ClipGenerator
+from benchmarks.fake_bot_api import FakeBotAPI
+from benchmarks.synthetic import make_library, write_song
+
+class LatencyStats:
+    """Response times per kind of player action"""
+    def __init__(self) -> None:
+        self.samples: dict[str, list[float]] = {}
+        self.timeouts: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def record(self, action, seconds) -> None:
+        with self.lock:
+            self.samples.setdefault(action, []).append(seconds)
+
+    def record_timeout(self, action) -> None:
+        with self.lock:
+            self.timeouts[action] = self.timeouts.get(action, 0) + 1
+
+    def get_report(self) -> PrettyTable:
+        """Tabulate count and percentiles in ms for each action"""
+        report = PrettyTable()
+        report.field_names = ["Action", "Count", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)", "Timeouts"]
+        for action in sorted(set(self.samples) | set(self.timeouts)):
+            samples = sorted(self.samples.get(action, []))
+            def percentile(p):
+                return f"{samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1000:.0f}" if samples else "-"
+            report.add_row([
+                action, len(samples), percentile(50), percentile(95), percentile(99),
+                f"{samples[-1] * 1000:.0f}" if samples else "-", self.timeouts.get(action, 0)
+            ])
+        return report
+
+class LoadTest:
+    """Routes what the bot sends back to the simulated players"""
+    def __init__(self, api: FakeBotAPI, songs: list[dict], answer: dict, options: argparse.Namespace) -> None:
+        self.api = api
+        self.songs = songs
+        self.answer = answer
+        self.options = options
+        self.stats = LatencyStats()
+        self.inboxes: dict[int, queue.Queue] = {}
+        # Inline query ID -> time it was sent, until the bot answers it
+        self.pending_queries: dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.updates_sent = 0
+        api.add_listener(self.on_call)
+
+    def on_call(self, method, params, now) -> None:
+        """Hand each message the bot sends to its player, and time inline query answers"""
+        if method == 'answerInlineQuery':
+            with self.lock:
+                sent_at = self.pending_queries.pop(params.get('inline_query_id'), None)
+            if sent_at is not None:
+                self.stats.record('suggest', now - sent_at)
+        elif method in ('sendMessage', 'sendAudio', 'sendVoice'):
+            inbox = self.inboxes.get(int(params.get('chat_id', 0)))
+            if inbox is not None:
+                inbox.put((method, params.get('text', ''), now))
+
+    def push(self, update: dict) -> float:
+        """Send an update to the bot, returning when it was sent"""
+        with self.lock:
+            self.updates_sent += 1
+        sent_at = time.perf_counter()
+        self.api.push_update(update)
+        return sent_at
+
+class Player:
+    """One simulated player working through the game"""
+    def __init__(self, load_test: LoadTest, user_id: int, seed: int) -> None:
+        self.load_test = load_test
+        self.user_id = user_id
+        self.rng = random.Random(seed)
+        self.user = {'id': user_id, 'is_bot': False, 'first_name': f"Player {user_id}", 'username': f"player{user_id}"}
+        self.chat = {'id': user_id, 'type': 'private'}
+        self.inbox = queue.Queue()
+        load_test.inboxes[user_id] = self.inbox
+        self.queries = 0
+
+    def pause(self, low, high) -> None:
+        """Wait like a person would, scaled by --think-scale"""
+        time.sleep(self.rng.uniform(low, high) * self.load_test.options.think_scale)
+
+    def wait_for_step(self, action, sent_at) -> str | None:
+        """Wait for the message that ends a step (new options, or the answer) and time it"""
+        deadline = time.monotonic() + self.load_test.options.timeout
+        while True:
+            try:
+                method, text, received_at = self.inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                self.load_test.stats.record_timeout(action)
+                return None
+            if method == 'sendMessage' and (text.startswith("Choose an option") or text.startswith("The answer is")):
+                self.load_test.stats.record(action, received_at - sent_at)
+                return text
+
+    def start(self) -> str | None:
+        """Send /start"""
+        sent_at = self.load_test.push({'message': {
+            'message_id': 1, 'date': int(time.time()), 'chat': self.chat, 'from': self.user,
+            'text': "/start", 'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}]
+        }})
+        return self.wait_for_step('start', sent_at)
+
+    def pass_move(self) -> str | None:
+        """Press the Pass button"""
+        sent_at = self.load_test.push({'callback_query': {
+            'id': f"{self.user_id}-{time.monotonic_ns()}", 'from': self.user, 'chat_instance': str(self.user_id),
+            'data': "/pass",
+            'message': {'message_id': 1, 'date': int(time.time()), 'chat': self.chat, 'text': "Choose an option"}
+        }})
+        return self.wait_for_step('pass', sent_at)
+
+    def guess(self, song: dict) -> str | None:
+        """Type part of a song's title one character at a time, then pick it"""
+        typed = song['title'].lower()[:self.rng.randint(3, 14)]
+        for length in range(1, len(typed) + 1):
+            self.queries += 1
+            query_id = f"{self.user_id}-{self.queries}"
+            with self.load_test.lock:
+                self.load_test.pending_queries[query_id] = time.perf_counter()
+            self.load_test.push({'inline_query': {
+                'id': query_id, 'from': self.user, 'query': f"Guess: {typed[:length]}", 'offset': ""
+            }})
+            self.pause(0.08, 0.3)
+        sent_at = self.load_test.push({'chosen_inline_result': {
+            'result_id': song['videoId'], 'from': self.user, 'query': f"Guess: {typed}"
+        }})
+        return self.wait_for_step('guess', sent_at)
+
+    def run(self) -> None:
+        """Play one game: listen to each clip, then pass or guess"""
+        text = self.start()
+        for clip_num in range(6):
+            if text is None or text.startswith("The answer is"):
+                return
+            # Listen to the clip and think
+            self.pause(1, 4)
+            if self.rng.random() < 0.2 + 0.12 * clip_num:
+                text = self.guess(self.load_test.answer)
+            elif clip_num < 5 and self.rng.random() < 0.4:
+                text = self.pass_move()
+            else:
+                text = self.guess(self.rng.choice(self.load_test.songs))
+
+def prepare_bot_dir(work_dir: str, songs: list[dict], answer: dict, options: argparse.Namespace) -> None:
+    """Write the library, a prepared song with clips, and a Telegram config pointing at the fake API"""
+    with open(os.path.join(work_dir, 'library_cache'), 'w') as cache_fh:
+        for song in songs:
+            json.dump(song, cache_fh)
+            cache_fh.write('\n')
+    song_dir = os.path.join(work_dir, 'song_clips', answer['videoId'])
+    clip_generator = ClipGenerator(song_dir, profile=options.clip_profile)
+    write_song(clip_generator.full_song, duration=40)
+    clip_generator.generate_clips()
+    with open(os.path.join(song_dir, 'song.json'), 'w') as marker_fh:
+        json.dump(answer, marker_fh)
+
+def start_bot(work_dir: str, base_url: str, options: argparse.Namespace) -> subprocess.Popen:
+    """Run heardle-telegram.py against the fake API"""
+    with open(os.path.join(work_dir, 'telegram_config.json'), 'w') as config_fh:
+        json.dump({'api_token': "123456:LOADTEST", 'api_base_url': base_url}, config_fh)
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'heardle-telegram.py')
+    return subprocess.Popen(
+        [
+            sys.executable, script, '--no-notify', '--log-file', 'bot.log',
+            '--prepare-ahead', '0', '--clip-profile', options.clip_profile,
+            '--update-workers', str(options.update_workers), '--metrics-interval', '0'
+        ],
+        cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+def wait_for_bot(api: FakeBotAPI, bot: subprocess.Popen, timeout=300) -> None:
+    """Wait until the bot starts polling for updates"""
+    deadline = time.monotonic() + timeout
+    while api.calls['getUpdates'] == 0:
+        if bot.poll() is not None:
+            raise RuntimeError(f"Bot exited with code {bot.returncode} before it started polling")
+        if time.monotonic() > deadline:
+            raise TimeoutError("Bot didn't start polling")
+        time.sleep(0.2)
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(
+        description="Load-test the bot with simulated players",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        add_help=True
+    )
+    arg_parser.add_argument("--players", type=int, default=100, help="Number of simulated players")
+    arg_parser.add_argument("--songs", type=int, default=10000, help="Number of synthetic songs in the library")
+    arg_parser.add_argument("--ramp-up", type=float, default=10, help="Seconds over which players join")
+    arg_parser.add_argument("--think-scale", type=float, default=1.0, help="Multiplier for players' listening and typing pauses")
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="Mean Bot API response delay, in seconds")
+    arg_parser.add_argument("--jitter", type=float, default=0.02, help="Standard deviation of the Bot API delay, in seconds")
+    arg_parser.add_argument("--update-workers", type=int, default=4, help="--update-workers for the bot")
+    arg_parser.add_argument("--clip-profile", default='mp3', choices=ClipGenerator.clip_profiles.keys(), help="--clip-profile for the bot")
+    arg_parser.add_argument("--timeout", type=float, default=60, help="Seconds a player waits for a reply before giving up")
+    arg_parser.add_argument("--port", type=int, default=0, help="Port for the fake Bot API (default: any free port)")
+    arg_parser.add_argument("--keep", action='store_true', help="Keep the bot's working directory (with its log)")
+    return arg_parser.parse_args()
+
+if __name__ == '__main__':
+    options = parse_args()
+    work_dir = tempfile.mkdtemp(prefix='heardle-load-')
+    songs = make_library(options.songs)
+    answer = songs[0]
+    prepare_bot_dir(work_dir, songs, answer, options)
+    api = FakeBotAPI(options.port, latency=options.latency, jitter=options.jitter)
+    api.start()
+    load_test = LoadTest(api, songs, answer, options)
+    bot = start_bot(work_dir, api.get_base_url(), options)
+    try:
+        wait_for_bot(api, bot)
+        players = [Player(load_test, 1000 + player_num, player_num) for player_num in range(options.players)]
+        threads = []
+        start_time = time.perf_counter()
+        for player in players:
+            thread = threading.Thread(target=player.run, daemon=True)
+            thread.start()
+            threads.append(thread)
+            time.sleep(options.ramp_up / options.players)
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start_time
+    finally:
+        bot.send_signal(signal.SIGINT)
+        try:
+            bot.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+        api.stop()
+    print(f"{options.players} players, {options.songs} songs, Bot API latency {options.latency * 1000:.0f} ms")
+    print(load_test.stats.get_report())
+    print(
+        f"{load_test.updates_sent} updates in {elapsed:.1f} s ({load_test.updates_sent / elapsed:.1f} updates/s), "
+        f"{sum(api.calls.values())} Bot API calls ({sum(api.calls.values()) / elapsed:.1f} calls/s)"
+    )
+    if options.keep:
+        print(f"Bot log: {os.path.join(work_dir, 'bot.log')}")
+    else:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,84 @@
+"""
+Prepare a planned song through the song pipeline with a stand-in clip
+generator that fails on demand, and check the rotation after each attempt:
+a temporary failure keeps the song planned, a success clears earlier failures,
+and only enough unavailable-song failures in a row skip it, until the skip expires.
+Run from the repository root with `python -m benchmarks.song_rotation`
+"""
+import argparse
+import logging
+import os
+import tempfile
+from prettytable import PrettyTable
+from heardle_telegram import song_pipeline
+from heardle_telegram.process_song import SongUnavailable
+from heardle_telegram.song_pipeline import SongPipeline
+from heardle_telegram.song_rotation import SongRotation
+from heardle_telegram.ytmusic_library import Library
+from benchmarks.synthetic import write_library_cache
+
+class FailingClipGenerator:
+    """Stand-in for ClipGenerator that raises the next queued error instead of downloading"""
+    errors: list[Exception | None] = []
+
+    def __init__(self, song_dir, clip_cache=None, profile='mp3') -> None:
+        os.makedirs(song_dir, exist_ok=True)
+
+    def prepare_song(self, song) -> None:
+        error = self.errors.pop(0)
+        if error is not None:
+            raise error
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(
+        description="Check which song preparation failures skip a song in the rotation",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        add_help=True
+    )
+    arg_parser.add_argument("--songs", type=int, default=1000, help="Number of synthetic songs in the library")
+    arg_parser.add_argument("--max-failures", type=int, default=3, help="Unavailable-song failures in a row before a skip")
+    return arg_parser.parse_args()
+
+if __name__ == '__main__':
+    options = parse_args()
+    logging.disable(logging.CRITICAL)
+    song_pipeline.ClipGenerator = FailingClipGenerator
+    report = PrettyTable()
+    report.field_names = ["Step", "Failures", "Planned", "Skipped"]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = os.path.join(tmp_dir, 'library_cache')
+        write_library_cache(cache, options.songs)
+        library = Library(cache=cache)
+        history = os.path.join(tmp_dir, 'play_history.db')
+        rotation = SongRotation(library, path=history, max_failures=options.max_failures)
+        pipeline = SongPipeline(library, clip_root=os.path.join(tmp_dir, 'song_clips'), rotation=rotation)
+        song_id = rotation.plan(1)[0]
+        song = library.songs[song_id]
+
+        def attempt(step: str, error: Exception | None, failures: int, planned: bool) -> None:
+            """Prepare the song once, failing with `error`, and check where it stands in the rotation"""
+            FailingClipGenerator.errors.append(error)
+            try:
+                pipeline.prepare_song(song)
+            except Exception:
+                pass
+            pipeline.release(song)
+            is_planned = song_id in rotation.plan(1)
+            report.add_row([step, rotation.failures.get(song_id, 0), is_planned, rotation.is_skipped(song_id)])
+            if rotation.failures.get(song_id, 0) != failures or is_planned != planned or rotation.is_skipped(song_id) == planned:
+                raise SystemExit(f"{step}: song has {rotation.failures.get(song_id, 0)} failures, planned {is_planned}")
+
+        attempt("Connection error", ConnectionError("Simulated network failure"), 0, True)
+        for failure in range(1, options.max_failures):
+            attempt(f"Unavailable #{failure}", SongUnavailable("Video unavailable"), failure, True)
+        attempt("Prepared", None, 0, True)
+        for failure in range(1, options.max_failures):
+            attempt(f"Unavailable #{failure}", SongUnavailable("Video unavailable"), failure, True)
+        attempt(f"Unavailable #{options.max_failures}", SongUnavailable("Video unavailable"), 0, False)
+
+        # Reloaded with skips that have already expired
+        rotation = SongRotation(library, path=history, max_failures=options.max_failures, skip_days=0)
+        report.add_row(["Skip expired", rotation.failures.get(song_id, 0), "-", rotation.is_skipped(song_id)])
+        if rotation.is_skipped(song_id):
+            raise SystemExit("Skip expired: song is still skipped")
+    print(report)
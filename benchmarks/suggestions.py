@@ -0,0 +1,62 @@
+"""
+Compare indexed, ranked song suggestions against the original linear scan.
+Run from the repository root with `python -m benchmarks.suggestions`
+"""
+import argparse
+import itertools
+import os
+import tempfile
+import time
+from heardle_telegram.ytmusic_library import Library
+from benchmarks.synthetic import write_library_cache
+
+def scan_song_suggestions(library: Library, substr: str, max_results: int):
+    """Original linear-scan implementation of Library.get_song_suggestions"""
+    n_results = 0
+    substr = substr.lower()
+    for (_, song) in library.songs.items():
+        if substr in str(song).lower():
+            n_results += 1
+            yield song
+            if n_results >= max_results:
+                break
+
+def time_queries(suggest, queries: list[str], max_results: int, repeat: int) -> float:
+    """Mean time per query in milliseconds"""
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            list(suggest(query, max_results))
+    return (time.perf_counter() - start_time) * 1000 / (repeat * len(queries))
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark song suggestions",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        add_help=True
+    )
+    arg_parser.add_argument("--songs", type=int, default=50000, help="Number of synthetic songs")
+    arg_parser.add_argument("--max-results", type=int, default=50, help="Maximum suggestions per query")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="Repetitions of the query set")
+    return arg_parser.parse_args()
+
+if __name__ == '__main__':
+    options = parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = os.path.join(tmp_dir, 'library_cache')
+        write_library_cache(cache, options.songs)
+        library = Library(cache=cache)
+    queries = ["l", "lo", "lov", "love", "love n", "midnight par", "the ghost 12", "zzz", "live)"]
+    for query in queries:
+        indexed = [song.get_id() for song in library.index.search(query)]
+        scanned = [song.get_id() for song in scan_song_suggestions(library, query, len(library.songs))]
+        assert indexed == scanned, f"Mismatch for query {query!r}"
+        ranked = library.get_song_suggestions(query, len(library.songs))
+        assert sorted(song.get_id() for song in ranked) == sorted(scanned), f"Ranking lost matches for {query!r}"
+    print(f"{options.songs} songs, {len(queries)} queries, max {options.max_results} results")
+    for name, suggest in [
+        ("scan", lambda query, n: scan_song_suggestions(library, query, n)),
+        ("index", lambda query, n: itertools.islice(library.index.search(query), n)),
+        ("ranked", library.get_song_suggestions)
+    ]:
+        print(f"{name:>8}: {time_queries(suggest, queries, options.max_results, options.repeat):.3f} ms/query")
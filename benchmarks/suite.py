@@ -0,0 +1,174 @@
+"""
+Time the library, suggestion, game and clip hot paths on synthetic data,
+and write the results as JSON to compare between commits.
+Run from the repository root with
+`python -m benchmarks.suite --output results.json [--compare baseline.json]`
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+from prettytable import PrettyTable
+from heardle_telegram.game import Game
+from heardle_telegram.process_song import ClipGenerator
+from heardle_telegram.ytmusic_library import Library
+from benchmarks.synthetic import write_library_cache, write_song
+
+def measure(function: Callable, repeat: int, number: int = 1) -> float:
+    """Median seconds per call over `repeat` runs of `number` calls"""
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start_time) / number)
+    return statistics.median(timings)
+
+def measure_peak(function: Callable) -> int:
+    """Peak Python memory allocated during one call, in KB"""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+class Suite:
+    """Collects results as rows of name, library size, seconds per call and peak memory"""
+    def __init__(self, repeat: int) -> None:
+        self.repeat = repeat
+        self.results: list[dict] = []
+
+    def run(self, name, songs, function: Callable, number=1, repeat=None, memory=True, batch=1) -> None:
+        """
+        Time a function, then measure its memory peak in a separate call.
+        `batch` is the number of operations each call does, to report time per operation
+        """
+        seconds = measure(function, repeat or self.repeat, number) / batch
+        peak_kb = measure_peak(function) if memory else None
+        self.results.append({'name': name, 'songs': songs, 'seconds': seconds, 'peak_kb': peak_kb})
+        logging.info(f"{name} ({songs} songs): {seconds * 1000:.3f} ms, peak {peak_kb} KB")
+
+    def run_library(self, n_songs: int, tmp_dir: str, rng: random.Random, players: int) -> None:
+        """Benchmarks that depend on the library size"""
+        cache = os.path.join(tmp_dir, f"library_cache_{n_songs}")
+        write_library_cache(cache, n_songs)
+        library = Library(cache=cache)
+
+        def read_cache():
+            library.songs = {}
+            library.read_cache()
+        self.run('read_cache', n_songs, read_cache, repeat=min(self.repeat, 3))
+
+        song_list = list(library.songs.values())
+        for query_length in (1, 2, 3, 5, 8):
+            queries = [str(song).lower()[:query_length] for song in rng.sample(song_list, min(50, n_songs))]
+            self.run(
+                f'suggestions_len{query_length}', n_songs,
+                lambda: [library.get_song_suggestions(query, 50) for query in queries],
+                memory=query_length == 3, batch=len(queries)
+            )
+
+        self.run('get_random_song', n_songs, library.get_random_song, number=1000, memory=False)
+
+        game = Game(song_list[0], None, library)
+        guess_ids = [song.get_id() for song in rng.sample(song_list, min(1000, n_songs))]
+        self.run('check_guess', n_songs, lambda: [game.check_guess(guess_id) for guess_id in guess_ids], memory=False, batch=len(guess_ids))
+
+        for user_id in range(players):
+            game.new_user_game({'id': user_id, 'username': f"player{user_id}"})
+            game.register_final_score(user_id, rng.randint(1, 7))
+
+        def show_scoreboard():
+            # Render every time; the game caches its scoreboard until the next score
+            game.scoreboard = None
+            return game.show_scoreboard()
+        self.run(f'show_scoreboard_{players}', n_songs, show_scoreboard, repeat=min(self.repeat, 3))
+        self.run(f'show_scoreboard_cached_{players}', n_songs, game.show_scoreboard, number=1000, memory=False)
+
+    def run_clips(self, tmp_dir: str) -> None:
+        """Clip generation, which doesn't depend on the library"""
+        clip_generator = ClipGenerator(os.path.join(tmp_dir, 'clips'))
+        write_song(clip_generator.full_song)
+        self.run('generate_clips', 0, clip_generator.generate_clips, repeat=min(self.repeat, 3))
+        # Most of the work is in ffmpeg, so also record the largest child process
+        self.results[-1]['child_peak_kb'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+def get_commit() -> str | None:
+    """Get the commit being benchmarked, if this is a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> PrettyTable:
+    """Tabulate results next to a baseline, flagging slowdowns beyond the threshold"""
+    baseline_times = {(result['name'], result['songs']): result['seconds'] for result in baseline}
+    report = PrettyTable()
+    report.field_names = ["Benchmark", "Songs", "Baseline (us)", "Now (us)", "Change", ""]
+    for result in results:
+        before = baseline_times.get((result['name'], result['songs']))
+        change = result['seconds'] / before - 1 if before else None
+        report.add_row([
+            result['name'], result['songs'],
+            f"{before * 1e6:.1f}" if before else "-",
+            f"{result['seconds'] * 1e6:.1f}",
+            f"{change:+.0%}" if change is not None else "-",
+            "SLOWER" if change is not None and change > threshold else ""
+        ])
+    return report
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark library, suggestion, game and clip hot paths",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        add_help=True
+    )
+    arg_parser.add_argument("--sizes", type=int, nargs='+', default=[1000, 10000, 100000], help="Synthetic library sizes")
+    arg_parser.add_argument("--players", type=int, default=5000, help="Players on the scoreboard")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="Runs per benchmark (the median is kept)")
+    arg_parser.add_argument("--skip-clips", action='store_true', help="Skip clip generation (needs ffmpeg)")
+    arg_parser.add_argument("--output", default=None, help="JSON file to write results to")
+    arg_parser.add_argument("--compare", default=None, help="JSON results of an earlier run to compare against")
+    arg_parser.add_argument("--threshold", type=float, default=0.1, help="Slowdown flagged when comparing, as a fraction")
+    return arg_parser.parse_args()
+
+if __name__ == '__main__':
+    options = parse_args()
+    logging.basicConfig(format='[%(asctime)s][%(levelname)s] %(message)s', level=logging.WARNING)
+    suite = Suite(options.repeat)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_songs in options.sizes:
+            suite.run_library(n_songs, tmp_dir, random.Random(n_songs), options.players)
+        if not options.skip_clips:
+            suite.run_clips(tmp_dir)
+    output = {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'results': suite.results
+    }
+    if options.output:
+        with open(options.output, 'w') as output_fh:
+            json.dump(output, output_fh, indent=2)
+    if options.compare:
+        with open(options.compare) as baseline_fh:
+            baseline = json.load(baseline_fh)
+        print(f"Compared with {baseline.get('commit')} ({baseline.get('time')})")
+        print(compare(suite.results, baseline['results'], options.threshold))
+    else:
+        report = PrettyTable()
+        report.field_names = ["Benchmark", "Songs", "Time (us)", "Peak (KB)"]
+        for result in suite.results:
+            report.add_row([result['name'], result['songs'], f"{result['seconds'] * 1e6:.1f}", result['peak_kb'] if result['peak_kb'] is not None else "-"])
+        print(report)
@@ -0,0 +1,87 @@
+import json
+import math
+import random
+import string
+
+WORDS = [
+    "love", "night", "heart", "fire", "dance", "dream", "light", "rain", "home",
+    "blue", "summer", "baby", "river", "gold", "wild", "young", "road", "moon",
+    "ghost", "stone", "city", "electric", "sweet", "midnight", "paradise",
+    "shadow", "crazy", "forever", "lonely", "radio"
+]
+
+def make_video_id(rng: random.Random) -> str:
+    """Make a random 11-character YouTube-style video ID"""
+    return ''.join(rng.choices(string.ascii_letters + string.digits + '-_', k=11))
+
+def make_song_entry(rng: random.Random, n_artists: int) -> dict:
+    """Make one ytmusicapi-style library entry"""
+    title = ' '.join(rng.choices(WORDS, k=rng.randint(1, 4))).title()
+    if rng.random() < 0.1:
+        title += rng.choice([" (Remastered 2011)", " (Live)", " - Radio Edit"])
+    artist = f"The {rng.choice(WORDS).title()} {rng.randrange(n_artists)}"
+    return {
+        'videoId': make_video_id(rng),
+        'title': title,
+        'artists': [{'name': artist, 'id': None}],
+        'album': {'name': ' '.join(rng.choices(WORDS, k=2)).title(), 'id': None},
+        'duration': f"{rng.randint(1, 9)}:{rng.randint(0, 59):02d}",
+        'thumbnails': [{'url': "https://example.invalid/thumb.jpg", 'width': 60, 'height': 60}]
+    }
+
+def make_library(n_songs: int, seed: int = 0) -> list[dict]:
+    """Make a synthetic library of unique songs"""
+    rng = random.Random(seed)
+    n_artists = max(1, n_songs // 20)
+    entries = {}
+    while len(entries) < n_songs:
+        entry = make_song_entry(rng, n_artists)
+        entries[entry['videoId']] = entry
+    return list(entries.values())
+
+def write_library_cache(path: str, n_songs: int, seed: int = 0) -> None:
+    """Write a synthetic library in the JSON Lines cache format"""
+    with open(path, 'w') as cache_fh:
+        for entry in make_library(n_songs, seed):
+            json.dump(entry, cache_fh)
+            cache_fh.write('\n')
+
+def write_song(path: str, duration: int = 240, leading_silence: int = 3, seed: int = 0) -> None:
+    """Write a synthetic MP3 of chords and noise after some silence"""
+    import numpy as np
+    from pydub import AudioSegment
+    frame_rate = 44100
+    rng = np.random.default_rng(seed)
+    t = np.arange(duration * frame_rate) / frame_rate
+    signal = sum(np.sin(2 * np.pi * f * t) for f in (220, 277, 330)) / 3
+    signal = 0.5 * signal * (1 + np.sin(2 * np.pi * 0.5 * t)) / 2 + 0.05 * rng.standard_normal(len(t))
+    samples = (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+    samples = np.concatenate((np.zeros(leading_silence * frame_rate, dtype=np.int16), samples))
+    song = AudioSegment(data=np.repeat(samples, 2).tobytes(), sample_width=2, frame_rate=frame_rate, channels=2)
+    song.export(path, format='mp3', bitrate='192k')
+
+class FakeYTMusic:
+    """Stand-in for YTMusicPager that serves a canned library without network access"""
+    # Songs per page, as YTMusic sends them
+    page_size = 25
+
+    def __init__(self, songs: list[dict], fail_after: int | None = None) -> None:
+        self.songs = songs
+        # Raise after this many requests, to simulate an interrupted sync
+        self.fail_after = fail_after
+        self.requests = 0
+
+    def get_page(self, order: str | None = None, continuation: str | None = None) -> tuple[list[dict], str | None]:
+        self.requests += 1
+        if self.fail_after is not None and self.requests > self.fail_after:
+            raise ConnectionError("Simulated network failure")
+        songs = self.songs[::-1] if order == 'recently_added' else self.songs
+        start = int(continuation) if continuation is not None else 0
+        end = start + self.page_size
+        return songs[start:end], str(end) if end < len(songs) else None
+
+    def get_library_songs(self, limit: int | None = 25, order: str | None = None) -> list[dict]:
+        """Fetch the library in one call, like YTMusic.get_library_songs"""
+        self.requests += math.ceil(len(self.songs) / self.page_size)
+        songs = self.songs[::-1] if order == 'recently_added' else self.songs
+        return songs[:limit]
@@ -3,7 +3,11 @@ import json
 import logging
 import os
 import time
+from queue import Queue
+# Everything imported from here on counts towards startup time in --profile-startup
+startup_time = time.perf_counter()
 from telegram import (
+    Bot,
     User,
     CallbackQuery,
     InputTextMessageContent,
@@ -12,8 +16,11 @@ from telegram import (
     InlineKeyboardButton,
     InlineKeyboardMarkup
 )
+from telegram.constants import MAX_INLINE_QUERY_RESULTS
+from telegram.error import TelegramError
+from telegram.utils.request import Request
 from telegram.ext import (
-    Updater,
+    JobQueue,
     CommandHandler,
     CallbackContext,
     InlineQueryHandler,
@@ -21,14 +28,38 @@ from telegram.ext import (
     ChosenInlineResultHandler
 )
 from heardle_telegram.ytmusic_library import Library
+from heardle_telegram.suggestion_cache import SuggestionCache
+from heardle_telegram.broadcast import Broadcaster
+from heardle_telegram.subscriber_store import SubscriberStore
+from heardle_telegram.stats_store import StatsStore
+from heardle_telegram.game_registry import GameRegistry, GameEntry
+from heardle_telegram.song_pipeline import SongPipeline
 from heardle_telegram.process_song import ClipGenerator
+from heardle_telegram.clip_cache import ClipCache
+from heardle_telegram.song_rotation import SongRotation
+from heardle_telegram.update_dispatch import ShardedDispatcher, WebhookUpdater
+from heardle_telegram.metrics import metrics, MetricsServer
+from heardle_telegram.query_coalescer import InlineQueryCoalescer
 from heardle_telegram.game import Game, UserGame
+from heardle_telegram.startup_profile import StartupProfile
 
+@metrics.timed('handler_start')
 def start(update: Update, context: CallbackContext) -> None:
     """Start a game when the command /start is issued."""
     logging.info("/start command received")
     user = update.effective_user
-    if game.check_user_started(user['id']):
+    game_entry = game_registry.get_for_chat(update.effective_chat.id)
+    if game_entry is None:
+        update.message.reply_text("No game is running")
+        return
+    game_registry.join(user['id'], game_entry.key)
+    game = game_entry.game
+    # Check and register under the game's lock so a double /start creates one user game
+    with game.lock:
+        already_started = game.check_user_started(user['id'])
+        if not already_started:
+            game.new_user_game(user)
+    if already_started:
         user_game = game.get_user_game(user['id'])
         if user_game.check_done():
             update.message.reply_markdown_v2(
@@ -45,19 +76,19 @@ def start(update: Update, context: CallbackContext) -> None:
             guess_count = user_game.get_guesses()
 
     else:
-        game.new_user_game(user)
         logging.info(f"Started game {hash(game)} for user {user['username']} [{user['id']}]")
         update.message.reply_markdown_v2(
             f"Started game for {user.mention_markdown_v2()}"
         )
         guess_count = 0
         # Start with the first (shortest) clip
-    update.message.reply_audio(
-        open(game.get_clip_file(guess_count), 'rb'),
+    game_entry.clip_delivery.send_clip(
+        context.bot, update.message.chat_id, guess_count,
         caption=f"Clip #{guess_count + 1}"
     )
     show_options(user, no_pass_button=(guess_count==5))
     
+@metrics.timed('handler_help')
 def help(update: Update, context: CallbackContext) -> None:
     """Help message"""
     logging.info("/help command received")
@@ -66,15 +97,77 @@ def help(update: Update, context: CallbackContext) -> None:
         "/help: Get this help message\n"
         "/start: Start playing current game, or retrieve current clip\n"
         "/status: Check whether game is running\n"
+        "/newgame: Start a separate game for a group chat\n"
+        "/stats: Show your results across games\n"
+        "/leaderboard: Show the best players of all time\n"
         "/subscribe: Subscribe to game start/score notifications\n"
         "/unsubscribe: Unsubscribe from game start/score notification\n"
         "Play using the chat buttons"
     )
 
+@metrics.timed('handler_stats')
+def stats(update: Update, stats_store: StatsStore) -> None:
+    """Show a player's results across games"""
+    logging.info("/stats command received")
+    user = update.effective_user
+    user_stats = stats_store.show_user_stats(user['id'])
+    if user_stats is None:
+        update.message.reply_text("You haven't finished a game yet")
+        return
+    update.message.reply_markdown_v2(
+        f"Stats for {user.mention_markdown_v2()}:\n```\n{user_stats}\n```"
+    )
+
+@metrics.timed('handler_leaderboard')
+def leaderboard(update: Update, stats_store: StatsStore) -> None:
+    """Show the best players of all time"""
+    logging.info("/leaderboard command received")
+    update.message.reply_markdown_v2(f"All\\-time leaderboard:\n```\n{stats_store.show_top()}\n```")
+
+@metrics.timed('handler_status')
 def status(update: Update, context: CallbackContext) -> None:
     """Check whether game is running and current game ID"""
     logging.info("/status command received")
-    update.message.reply_text(f"Game {hash(game)} running")
+    game_entry = game_registry.get_for_chat(update.effective_chat.id)
+    if game_entry is None:
+        update.message.reply_text("No game is running")
+    else:
+        update.message.reply_text(f"Game {hash(game_entry.game)} running")
+
+@metrics.timed('handler_newgame')
+def new_game(update: Update, context: CallbackContext, ttl: float) -> None:
+    """Start a game for a group chat, separate from the main game"""
+    logging.info("/newgame command received")
+    chat = update.effective_chat
+    if chat.type == 'private':
+        update.message.reply_text("Use /newgame in a group to start a game for that group")
+        return
+    if game_registry.get(str(chat.id)) is not None:
+        update.message.reply_text("This group already has a game running. Send /start to play")
+        return
+    update.message.reply_text("Preparing a new game for this group...")
+    # Preparing a song can take a while, so don't hold up this user's other updates
+    context.dispatcher.run_async(create_group_game, update, ttl, update=update)
+
+def create_group_game(update: Update, ttl: float) -> None:
+    """Create a group's game, unless another /newgame got there first"""
+    if game_registry.create_game(str(update.effective_chat.id), ttl=ttl, if_absent=True) is None:
+        update.message.reply_text("This group already has a game running. Send /start to play")
+        return
+    update.message.reply_text("New game ready! Send /start to play")
+
+@metrics.timed('handler_expire_games')
+def end_expired_games(context: CallbackContext) -> None:
+    """End group games past their expiry time and post their scores"""
+    for game_entry in game_registry.expire():
+        answer = escape_answer_for_markdown(game_entry.game.get_song_answer())
+        context.bot.send_message(
+            chat_id=int(game_entry.key),
+            text=f"Game over! The answer was: [{answer[0]}]({answer[1]})\n\n"
+                 f"Final scores:\n```\n{game_entry.game.show_scoreboard()}\n```",
+            disable_web_page_preview=True,
+            parse_mode='MarkdownV2'
+        )
 
 def show_options(user: User, no_pass_button: bool=False) -> None:
     """Show options as an inline keyboard"""
@@ -92,30 +185,32 @@ def show_options(user: User, no_pass_button: bool=False) -> None:
         del keyboard[0][0]
     user.send_message("Choose an option", reply_markup=InlineKeyboardMarkup(keyboard))
 
+@metrics.timed('handler_keyboard')
 def keyboard_callback(update: Update, context: CallbackContext) -> None:
     if update.callback_query.data == "/pass":
         pass_move(update.callback_query, context)
     elif update.callback_query.data == "/giveup":
         give_up(update.callback_query, context)
 
-def increment_move(update: CallbackQuery|Update, game: Game, user_game: UserGame) -> None:
+def increment_move(update: CallbackQuery|Update, game_entry: GameEntry, user_game: UserGame) -> None:
     """Register a passed move when player passes or guesses wrong"""
     if hasattr(update, 'effective_user'):
         user = update.effective_user
     else:
         user = update.from_user
-    user_game.pass_move()
+    game = game_entry.game
+    game.pass_move(user['id'])
     guess_count = user_game.get_guesses()
     if guess_count < 6:
         # Send next clip
-        user.send_audio(
-            open(game.get_clip_file(user_game.get_guesses()), 'rb'),
-            caption=f"Clip #{user_game.get_guesses() + 1}"
+        game_entry.clip_delivery.send_clip(
+            user.bot, user['id'], guess_count,
+            caption=f"Clip #{guess_count + 1}"
         )
         show_options(user, no_pass_button=(guess_count==5))
     else:
         # Game over
-        user_game.set_defeat()
+        game.set_defeat(user['id'])
         game.register_final_score(user['id'], guess_count + 1)
         user.send_message(
             f"{user.mention_markdown_v2()} lost the game",
@@ -128,28 +223,33 @@ def not_started_message(user: User) -> None:
     logging.info(f"{user['id']} has not started this game")
     user.send_message("You have not started the current game")
 
+@metrics.timed('handler_pass')
 def pass_move(update: CallbackQuery, context: CallbackContext) -> None:
     """Pass and get next clip"""
     logging.info("/pass command received")
     user = update.from_user
-    if not game.check_user_started(user['id']):		
+    game_entry = game_registry.get_for_user(user['id'])
+    if game_entry is None or not game_entry.game.check_user_started(user['id']):
         not_started_message(user)
         return
-    user_game = game.get_user_game(user['id'])
+    user_game = game_entry.game.get_user_game(user['id'])
     if user_game.check_done():
         update.message.reply_markdown_v2(
             f"Game already finished for {user.mention_markdown_v2()}"
         )
         return
-    increment_move(update, game, user_game)
+    increment_move(update, game_entry, user_game)
 
+@metrics.timed('handler_guess')
 def guess(update: Update, context: CallbackContext) -> None:
     """Take a guess"""
     logging.info("Guess received")
     user = update.effective_user
-    if not game.check_user_started(user['id']):		
+    game_entry = game_registry.get_for_user(user['id'])
+    if game_entry is None or not game_entry.game.check_user_started(user['id']):
         not_started_message(user)
         return
+    game = game_entry.game
     user_game = game.get_user_game(user['id'])
     if user_game.check_done():
         user.send_message(
@@ -159,8 +259,11 @@ def guess(update: Update, context: CallbackContext) -> None:
         return
     guess_id = update.chosen_inline_result.result_id
     logging.info(f"Guess from user {user['username']} [{user['id']}]: {guess_id}")
-    if game.check_guess(guess_id) == (True, True):
-        user_game.set_success()
+    verdict = game.check_guess(guess_id)
+    metrics.increment('guesses')
+    if verdict.is_correct():
+        metrics.increment('guesses_correct')
+        game.set_success(user['id'])
         game.register_final_score(user['id'], user_game.get_guesses() + 1)
         user.send_message(
             f"{user.mention_markdown_v2()} finished in {user_game.get_guesses() + 1} moves\!",
@@ -168,13 +271,13 @@ def guess(update: Update, context: CallbackContext) -> None:
         )
         send_answer(user, game)
     else:
-        if game.check_guess(guess_id)[0]:
+        if verdict.artist:
             user.send_message("You got the artist right")
-        elif game.check_guess(guess_id)[1]:
+        elif verdict.title:
             user.send_message("You got the title right")
         else:
             user.send_message("Wrong answer")
-        increment_move(update, game, user_game)
+        increment_move(update, game_entry, user_game)
 
 def escape_answer_for_markdown(answer) -> tuple[str, str]:
     """Escape characters in answer for markdown response"""
@@ -189,33 +292,46 @@ def send_answer(user: User, game: Game) -> None:
         parse_mode='MarkdownV2'
     )
 
+@metrics.timed('handler_giveup')
 def give_up(update: CallbackQuery, context: CallbackContext) -> None:
     """Give up and show the answer"""
     logging.info("/giveup command received")
     user = update.from_user
-    if not game.check_user_started(user['id']):		
+    game_entry = game_registry.get_for_user(user['id'])
+    if game_entry is None or not game_entry.game.check_user_started(user['id']):
         not_started_message(user)
         return
+    game = game_entry.game
     user_game = game.get_user_game(user['id'])
     if user_game.check_done():
         update.message.reply_markdown_v2(
             f"Game already finished for {user.mention_markdown_v2()}"
         )
     else:
-        user_game.set_defeat()
+        game.set_defeat(user['id'])
         game.register_final_score(user['id'], 7)
     send_answer(user, game)
 
+@metrics.timed('handler_suggest')
 def suggest_songs(update: Update, max_results) -> None:
-    """Autocomplete suggestions for guesses"""
+    """Autocomplete suggestions for guesses, one page at a time"""
     # Strip the first 7 characters: "Guess: "
     query = update.inline_query.query[7:]
     
     if query == "":
         return
 
+    # The offset is empty for the first page, then whatever next_offset we sent
+    offset = update.inline_query.offset
+    offset = int(offset) if offset.isdigit() else 0
+    # Ask for one more than a page to know whether there is a next page
+    limit = min(offset + MAX_INLINE_QUERY_RESULTS + 1, max_results)
+    suggestions = suggestion_cache.get_song_suggestions(query, max_results=limit, offset=offset)
+    page = suggestions[:MAX_INLINE_QUERY_RESULTS]
+    next_offset = str(offset + len(page)) if len(suggestions) > len(page) else ""
+
     results = []
-    for suggestion in library.get_song_suggestions(query, max_results=max_results):
+    for suggestion in page:
         results.append(
             InlineQueryResultArticle(
                 id=suggestion.get_id(),
@@ -224,15 +340,13 @@ def suggest_songs(update: Update, max_results) -> None:
             )
         )
 
-    update.inline_query.answer(results, auto_pagination=True)
+    update.inline_query.answer(results, next_offset=next_offset)
 
-def subscribe(update: Update, config_file: str) -> None:
+@metrics.timed('handler_subscribe')
+def subscribe(update: Update, subscriber_store: SubscriberStore) -> None:
     """Subscribe a user to receive game start/score notifications"""
     user_id = update.effective_user['id']
-    telegram_config = json.load(open(config_file))
-    if user_id not in telegram_config['subscribers']:
-        telegram_config['subscribers'].append(user_id)
-        json.dump(telegram_config, open(config_file, 'w'), indent=4)
+    if subscriber_store.add(user_id):
         logging.info(f"{user_id} subscribed")
         update.message.reply_text(
             "You are now subscribed to game start/score notifications. "
@@ -244,13 +358,11 @@ def subscribe(update: Update, config_file: str) -> None:
             "You are already subscribed to game start/score notifications."
         )
 
-def unsubscribe(update: Update, config_file: str) -> None:
+@metrics.timed('handler_unsubscribe')
+def unsubscribe(update: Update, subscriber_store: SubscriberStore) -> None:
     """Unsubscribe a user from receiving game start/score notifications"""
     user_id = update.effective_user['id']
-    telegram_config = json.load(open(config_file))
-    if user_id in telegram_config['subscribers']:
-        telegram_config['subscribers'].remove(user_id)
-        json.dump(telegram_config, open(config_file, 'w'), indent=4)
+    if subscriber_store.remove(user_id):
         logging.info(f"{user_id} unsubscribed")
         update.message.reply_text(
             "You have unsubscribed from game start/score notifications. "
@@ -282,80 +394,344 @@ def parse_args() -> argparse.Namespace:
         default='library_cache',
         help="File to use as library of songs"
     )
+    arg_parser.add_argument(
+        "--snapshot",
+        default='library.db',
+        help="Indexed snapshot of the library, written from --cache when missing or outdated"
+    )
+    arg_parser.add_argument(
+        "--aliases",
+        default=None,
+        help="JSON file of other names for artists and titles that count as correct guesses"
+    )
     arg_parser.add_argument(
         "--telegram-config",
         default='telegram_config.json',
         help="File containing config data for Telegram"
     )
+    arg_parser.add_argument(
+        "--subscribers",
+        default='subscribers.db',
+        help="Database of chats subscribed to notifications"
+    )
+    arg_parser.add_argument(
+        "--journal",
+        default='game_journal',
+        help="Journal of the current game's moves, used to recover it after a restart"
+    )
+    arg_parser.add_argument(
+        "--stats",
+        default='stats.db',
+        help="Database of players' results across games"
+    )
+    arg_parser.add_argument(
+        "--group-game-hours",
+        type=float, default=24,
+        help="How long group games started with /newgame last"
+    )
     arg_parser.add_argument(
         "--max-suggestions",
         type=int, default=999,
         help="Maximum number of suggestions shown while guessing"
     )
+    arg_parser.add_argument(
+        "--suggestion-cache-size",
+        type=int, default=1024,
+        help="Number of recent guess queries to cache suggestions for"
+    )
+    arg_parser.add_argument(
+        "--suggestion-debounce",
+        type=int, default=40,
+        help="Milliseconds to wait for a newer query from the same player before suggesting songs"
+    )
+    arg_parser.add_argument(
+        "--clip-dir",
+        default='song_clips',
+        help="Directory to prepare song clips in"
+    )
+    arg_parser.add_argument(
+        "--prepare-ahead",
+        type=int, default=2,
+        help="Number of upcoming songs to download and clip in the background"
+    )
+    arg_parser.add_argument(
+        "--clip-disk-budget",
+        type=int, default=None,
+        help="Stop preparing upcoming songs while clips use more than this many MB"
+    )
+    arg_parser.add_argument(
+        "--clip-cache-dir",
+        default='clip_cache',
+        help="Directory to keep clips of previously played songs in"
+    )
+    arg_parser.add_argument(
+        "--clip-cache-size",
+        type=int, default=500,
+        help="Maximum size of the clip cache in MB"
+    )
+    arg_parser.add_argument(
+        "--clip-profile",
+        default='mp3',
+        choices=ClipGenerator.clip_profiles.keys(),
+        help="Format and bitrate of clips (opus profiles are sent as voice messages)"
+    )
+    arg_parser.add_argument(
+        "--play-history",
+        default='play_history.db',
+        help="Database of songs played and planned, used to avoid repeats"
+    )
+    arg_parser.add_argument(
+        "--song-repeat-window",
+        type=int, default=365,
+        help="Number of games before the same song can be picked again"
+    )
+    arg_parser.add_argument(
+        "--artist-repeat-window",
+        type=int, default=3,
+        help="Number of games before a song by the same artist can be picked again"
+    )
+    arg_parser.add_argument(
+        "--rotation-weighting",
+        default='uniform',
+        choices=SongRotation.weightings,
+        help="Pick songs uniformly, favour songs played fewer times (plays), or favour songs not played for longer (recency)"
+    )
+    arg_parser.add_argument(
+        "--rotation-seed",
+        type=int, default=0,
+        help="Seed for picking songs, so upcoming picks can be reproduced"
+    )
+    arg_parser.add_argument(
+        "--update-workers",
+        type=int, default=4,
+        help="Number of threads handling updates (each user's updates are handled in order)"
+    )
+    arg_parser.add_argument(
+        "--update-queue-size",
+        type=int, default=100,
+        help="Updates waiting for each update worker before new updates are held back"
+    )
+    arg_parser.add_argument(
+        "--webhook-port",
+        type=int, default=None,
+        help="Receive updates through a webhook server on this port instead of polling"
+    )
+    arg_parser.add_argument(
+        "--webhook-listen",
+        default='127.0.0.1',
+        help="Address for the webhook server to listen on"
+    )
+    arg_parser.add_argument(
+        "--webhook-path",
+        default=None,
+        help="URL path for webhook updates (default: the bot's API token)"
+    )
+    arg_parser.add_argument(
+        "--webhook-url",
+        default=None,
+        help="Public HTTPS URL Telegram should send updates to, e.g. behind a reverse proxy; without it the webhook isn't registered"
+    )
+    arg_parser.add_argument(
+        "--metrics-port",
+        type=int, default=None,
+        help="Serve metrics on this local port at /metrics (Prometheus) and /metrics.json"
+    )
+    arg_parser.add_argument(
+        "--metrics-interval",
+        type=int, default=300,
+        help="Seconds between metrics summaries in the log (0 to disable)"
+    )
+    arg_parser.add_argument(
+        "--broadcast-workers",
+        type=int, default=8,
+        help="Number of threads sending notifications to subscribers"
+    )
+    arg_parser.add_argument(
+        "--profile-startup",
+        action='store_true',
+        help="Log how long imports, loading the library, preparing the game (and its clips) and connecting to Telegram took"
+    )
     return arg_parser.parse_args()
 
 
-def main(options: argparse.Namespace) -> None:
+def main(options: argparse.Namespace, startup_profile: StartupProfile) -> None:
     global library
-    library = Library(cache=options.cache)
-    # Pick a random song
-    song = library.get_random_song()
-    # Download the song and generate clips
-    clip_generator = ClipGenerator()
-    clip_generator.prepare_song(song)
+    library = Library(cache=options.cache, snapshot=options.snapshot, aliases=options.aliases)
+    startup_profile.mark('library')
+    global suggestion_cache
+    suggestion_cache = SuggestionCache(library, max_entries=options.suggestion_cache_size)
+    # Take a song prepared in advance (or download it and generate clips now)
+    song_pipeline = SongPipeline(
+        library,
+        clip_root=options.clip_dir,
+        queue_depth=options.prepare_ahead,
+        disk_budget=options.clip_disk_budget * 2**20 if options.clip_disk_budget else None,
+        clip_cache=ClipCache(options.clip_cache_dir, max_bytes=options.clip_cache_size * 2**20),
+        profile=options.clip_profile,
+        rotation=SongRotation(
+            library,
+            path=options.play_history,
+            song_window=options.song_repeat_window,
+            artist_window=options.artist_repeat_window,
+            weighting=options.rotation_weighting,
+            seed=options.rotation_seed
+        )
+    )
 
-    global game
-    game = Game(song, clip_generator, library)
+    global game_registry
+    stats_store = StatsStore(options.stats)
+    game_registry = GameRegistry(library, song_pipeline, journal_prefix=options.journal, stats=stats_store)
+    # Pick up games interrupted by a crash or restart, if there are any
+    game_registry.recover_all()
+    resumed = game_registry.get(GameRegistry.default_key) is not None
+    if not resumed:
+        game_registry.create_game(GameRegistry.default_key)
+    default_game = game_registry.get(GameRegistry.default_key)
+    startup_profile.mark('game')
 
     # Configure Telegram API
     telegram_config = json.load(open(options.telegram_config))
     telegram_api_token = telegram_config['api_token']
+    subscriber_store = SubscriberStore(options.subscribers)
+    if subscriber_store.is_new:
+        # Subscribers used to be listed in the Telegram config
+        subscriber_store.import_subscribers(telegram_config.get('subscribers', []))
+
+    # Handle updates on a pool of workers, keeping each user's updates in order
+    bot = Bot(
+        telegram_api_token,
+        # Only set to point the bot at a stand-in API, e.g. for load tests
+        base_url=telegram_config.get('api_base_url'),
+        request=Request(con_pool_size=options.update_workers + options.broadcast_workers + 4)
+    )
+    job_queue = JobQueue()
+    dispatcher = ShardedDispatcher(
+        bot, Queue(),
+        job_queue=job_queue,
+        shards=options.update_workers,
+        shard_queue_size=options.update_queue_size
+    )
+    job_queue.set_dispatcher(dispatcher)
+    # Without --webhook-url the webhook server only takes updates posted to it locally
+    updater = WebhookUpdater(dispatcher=dispatcher, workers=None, register_webhook=options.webhook_url is not None)
 
-    updater = Updater(token=telegram_api_token)
-    dispatcher = updater.dispatcher
+    # Upload clips once so players get them by file_id
+    if telegram_config.get('clip_chat_id') is not None:
+        try:
+            default_game.clip_delivery.upload_all(updater.bot, telegram_config['clip_chat_id'])
+        except (TelegramError, OSError) as e:
+            logging.warning(f"Could not upload clips in advance ({e}), uploading on first use")
 
     # Command handlers
     dispatcher.add_handler(CommandHandler("start", start))
     dispatcher.add_handler(CommandHandler("status", status))
     dispatcher.add_handler(CommandHandler("subscribe",
-        lambda update, context: subscribe(update, options.telegram_config)
+        lambda update, context: subscribe(update, subscriber_store)
     ))
     dispatcher.add_handler(CommandHandler("unsubscribe",
-        lambda update, context: unsubscribe(update, options.telegram_config)
+        lambda update, context: unsubscribe(update, subscriber_store)
     ))
     dispatcher.add_handler(CommandHandler("help", help))
+    dispatcher.add_handler(CommandHandler("stats",
+        lambda update, context: stats(update, stats_store)
+    ))
+    dispatcher.add_handler(CommandHandler("leaderboard",
+        lambda update, context: leaderboard(update, stats_store)
+    ))
+    dispatcher.add_handler(CommandHandler("newgame",
+        lambda update, context: new_game(update, context, options.group_game_hours * 3600)
+    ))
+    # Only answer each player's latest query while they type
+    query_coalescer = InlineQueryCoalescer(delay=options.suggestion_debounce / 1000)
+    dispatcher.add_ingest_listener(query_coalescer.note)
     dispatcher.add_handler(InlineQueryHandler(
-        lambda update, context: suggest_songs(update, options.max_suggestions),
+        lambda update, context: query_coalescer.submit(
+            update.inline_query,
+            lambda: suggest_songs(update, options.max_suggestions),
+            context.job_queue
+        ),
         pattern='Guess: .+'))
     dispatcher.add_handler(ChosenInlineResultHandler(guess))
     dispatcher.add_handler(CallbackQueryHandler(keyboard_callback))
 
     # Start the Bot
-    updater.start_polling(drop_pending_updates=True)
-    if not options.no_notify:
-        for subscriber in telegram_config['subscribers']:
-            updater.bot.send_message(
-                chat_id=subscriber,
-                text=f"Launched new game"
-            )
+    if options.webhook_port is not None:
+        url_path = options.webhook_path or telegram_api_token
+        updater.start_webhook(
+            listen=options.webhook_listen,
+            port=options.webhook_port,
+            url_path=url_path,
+            webhook_url=f"{options.webhook_url.rstrip('/')}/{url_path}" if options.webhook_url else None,
+            drop_pending_updates=True
+        )
+        if updater.webhook_error is not None:
+            logging.error(f"Webhook server failed to start: {updater.webhook_error}")
+            updater.stop()
+            raise SystemExit(1)
+        logging.info(f"Listening for webhook updates on {options.webhook_listen}:{options.webhook_port}")
+    else:
+        updater.start_polling(drop_pending_updates=True)
+    startup_profile.mark('telegram')
+    if options.profile_startup:
+        logging.info(f"Startup profile:\n{startup_profile.show(metrics)}")
+    # Prepare upcoming songs while this game runs
+    song_pipeline.start()
+    updater.job_queue.run_repeating(end_expired_games, interval=60)
+    updater.job_queue.run_repeating(
+        lambda context: logging.info(f"Update dispatch stats: {dispatcher.get_stats()}"),
+        interval=300
+    )
+    metrics.add_gauge('update_backlog', lambda: dispatcher.update_queue.qsize())
+    metrics.add_gauge('update_worker_queued', lambda: sum(dispatcher.get_stats()['queued']))
+    metrics.add_gauge('update_worker_blocked', lambda: dispatcher.get_stats()['blocked'])
+    metrics.add_gauge('games', lambda: len(game_registry.games))
+    metrics.add_gauge('songs_prepared', lambda: len(song_pipeline.list_prepared()))
+    metrics.add_gauge('suggestion_cache_hits', lambda: suggestion_cache.get_stats()['hits'])
+    metrics.add_gauge('suggestion_cache_misses', lambda: suggestion_cache.get_stats()['misses'])
+    metrics.add_gauge('inline_queries_dropped', lambda: query_coalescer.get_stats()['dropped'])
+    if options.metrics_interval > 0:
+        updater.job_queue.run_repeating(
+            lambda context: logging.info(f"Metrics:\n{metrics.format_summary()}"),
+            interval=options.metrics_interval
+        )
+    if options.metrics_port is not None:
+        metrics_server = MetricsServer(metrics, options.metrics_port)
+        metrics_server.start()
+    broadcaster = Broadcaster(updater.bot, workers=options.broadcast_workers)
+    if not options.no_notify and not resumed:
+        broadcaster.broadcast(
+            subscriber_store.get_subscribers(),
+            text=f"Launched new game"
+        )
     updater.idle()
+    song_pipeline.stop(timeout=5)
+    # Group games carry on after a restart; the main game ends here
+    game_registry.close()
 
     # End game
+    game = default_game.game
     scoreboard = game.show_scoreboard()
     logging.info(f"Final scores:\n{scoreboard}")
+    logging.info(f"Suggestion cache stats: {suggestion_cache.get_stats()}")
+    logging.info(f"Inline query stats: {query_coalescer.get_stats()}")
+    logging.info(f"Clip delivery stats: {default_game.clip_delivery.get_stats()}")
+    logging.info(f"Update dispatch stats: {dispatcher.get_stats()}")
+    logging.info(f"Metrics:\n{metrics.format_summary()}")
     # Send scoreboard to subscribers
     if not options.no_notify:
         answer = escape_answer_for_markdown(game.get_song_answer())
-        for subscriber in telegram_config['subscribers']:
-            updater.bot.send_message(
-                chat_id=subscriber,
-                text=f"The answer was: [{answer[0]}]({answer[1]})\n\n"
-                     f"Final scores:\n```\n{scoreboard}\n```",
-                disable_web_page_preview=True,
-                parse_mode='MarkdownV2'
-            )
+        broadcaster.broadcast(
+            subscriber_store.get_subscribers(),
+            text=f"The answer was: [{answer[0]}]({answer[1]})\n\n"
+                 f"Final scores:\n```\n{scoreboard}\n```",
+            disable_web_page_preview=True,
+            parse_mode='MarkdownV2'
+        )
+    game_registry.end_game(GameRegistry.default_key)
 
 if __name__ == '__main__':
+    startup_profile = StartupProfile(startup_time)
+    startup_profile.mark('imports')
     logging.basicConfig(
         format='[%(asctime)s][%(levelname)s] %(message)s',
         datefmt='%Y/%m/%d %H:%M:%S',
@@ -365,4 +741,4 @@ if __name__ == '__main__':
     if not options.log_file:
         options.log_file = os.path.join("logs", f"game{time.strftime('%Y%m%d%H%M%S', time.gmtime())}.log")
     logging.getLogger().addHandler(logging.FileHandler(options.log_file))
-    main(options)
+    main(options, startup_profile)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import re
+import unicodedata
+from typing import Callable, Iterable
+
+# "(feat. X)", "[with X]" anywhere, or a trailing "feat. X"
+FEATURING = re.compile(
+    r'\s*[\(\[]\s*(?:feat\.?|ft\.?|featuring|with)\s[^\)\]]*[\)\]]'
+    r'|\s+(?:feat\.|ft\.|featuring)\s.*$',
+    re.IGNORECASE
+)
+VERSION_WORDS = r'(?:remaster(?:ed)?|live|version|edit|mono|stereo|mix|demo|acoustic|session)'
+# "(Remastered 2011)", "[Live]", or a trailing " - 2011 Remaster", " - Live at Wembley"
+VERSION_SUFFIX = re.compile(
+    rf'\s*[\(\[][^\)\]]*\b{VERSION_WORDS}\b[^\)\]]*[\)\]]'
+    rf'|\s+-\s+[^-]*\b{VERSION_WORDS}\b.*$',
+    re.IGNORECASE
+)
+PUNCTUATION = re.compile(r'[^\w\s]')
+SPACES = re.compile(r'\s+')
+
+class GuessVerdict:
+    """Whether a guess got the artist and the title right"""
+    __slots__ = ('artist', 'title')
+
+    def __init__(self, artist: bool, title: bool) -> None:
+        self.artist = artist
+        self.title = title
+
+    def is_correct(self) -> bool:
+        """Check whether the guess is the answer"""
+        return self.artist and self.title
+
+    def __repr__(self):
+        return f"GuessVerdict(artist={self.artist}, title={self.title})"
+
+class AnswerKeys:
+    """
+    Canonical artist and title keys of every song in a library, computed once
+    when it loads. Keys ignore case, accents, punctuation, featured artists and
+    remaster/live/edit suffixes, and each distinct key is numbered, so checking
+    a guess is one lookup and one comparison of a pair of ints.
+    An optional alias table maps other spellings (e.g. duplicates uploaded
+    under a different artist name) onto one canonical name
+    """
+    # Bump when normalisation changes, so keys saved in library snapshots are recomputed
+    version = 1
+
+    def __init__(self, songs: Iterable, aliases: dict | None = None) -> None:
+        aliases = aliases or {}
+        self.artist_aliases = {self.get_artist_key(alias): self.get_artist_key(name) for alias, name in aliases.get('artists', {}).items()}
+        self.title_aliases = {self.normalise(alias): self.normalise(name) for alias, name in aliases.get('titles', {}).items()}
+        self.artist_ids: dict[str, int] = {}
+        self.title_ids: dict[str, int] = {}
+        self.keys: dict[str, tuple[int, int]] = {}
+        # Artist names repeat across songs, so each one is only canonicalised once
+        self.artist_names: dict[str, int] = {}
+        # Reads artist_ids and title_ids when keys were loaded without them
+        self.read_ids: Callable[[], tuple[dict[str, int], dict[str, int]]] | None = None
+        for song in songs:
+            self.add(song)
+
+    @classmethod
+    def from_keys(cls, keys: dict[str, tuple[int, int]], aliases: dict | None, read_ids: Callable) -> 'AnswerKeys':
+        """
+        Use keys computed earlier (e.g. saved in a library snapshot). The numbered
+        canonical names are only read with `read_ids` if a song outside the library is added
+        """
+        answer_keys = cls([], aliases)
+        answer_keys.keys = keys
+        answer_keys.read_ids = read_ids
+        return answer_keys
+
+    @classmethod
+    def get_fingerprint(cls, aliases: dict | None) -> str:
+        """Identify the normalisation and aliases keys were computed with"""
+        return hashlib.sha1(f"{cls.version}:{json.dumps(aliases or {}, sort_keys=True)}".encode()).hexdigest()
+
+    @staticmethod
+    def read_aliases(path) -> dict:
+        """Read an alias table: {"artists": {alias: name}, "titles": {alias: name}}"""
+        with open(path) as aliases_fh:
+            aliases = json.load(aliases_fh)
+        logging.info(
+            f"Read {len(aliases.get('artists', {}))} artist and "
+            f"{len(aliases.get('titles', {}))} title aliases from {path}"
+        )
+        return aliases
+
+    @staticmethod
+    def normalise(name: str) -> str:
+        """Lower-case, strip accents and punctuation, and collapse spaces"""
+        name = name.casefold()
+        if not name.isascii():
+            name = unicodedata.normalize('NFKD', name)
+            name = ''.join(char for char in name if not unicodedata.combining(char))
+        name = PUNCTUATION.sub(' ', name.replace('&', ' and '))
+        return SPACES.sub(' ', name).strip()
+
+    def get_artist_key(self, artist: str) -> str:
+        """Normalise an artist name, dropping featured artists and a leading "The" """
+        key = self.normalise(FEATURING.sub('', artist))
+        return key[4:] if key.startswith('the ') else key
+
+    def canonical_artist(self, artist: str) -> str:
+        """Get the key an artist name is compared by"""
+        key = self.get_artist_key(artist)
+        return self.artist_aliases.get(key, key)
+
+    def canonical_title(self, title: str) -> str:
+        """Get the key a song title is compared by"""
+        stripped = VERSION_SUFFIX.sub('', FEATURING.sub('', title))
+        # Keep titles that are nothing but a suffix, e.g. "(Live)"
+        key = self.normalise(stripped) or self.normalise(title)
+        return self.title_aliases.get(key, key)
+
+    def add(self, song) -> tuple[int, int]:
+        """Compute and store the keys of one song"""
+        if self.read_ids is not None:
+            self.artist_ids, self.title_ids = self.read_ids()
+            self.read_ids = None
+        artist_id = self.artist_names.get(song.get_artist())
+        if artist_id is None:
+            artist_id = self.artist_ids.setdefault(self.canonical_artist(song.get_artist()), len(self.artist_ids))
+            self.artist_names[song.get_artist()] = artist_id
+        title_id = self.title_ids.setdefault(self.canonical_title(song.get_title()), len(self.title_ids))
+        self.keys[song.get_id()] = (artist_id, title_id)
+        return artist_id, title_id
+
+    def get_keys(self, song) -> tuple[int, int]:
+        """Get the artist and title keys of a song, computing them if it isn't in the library"""
+        keys = self.keys.get(song.get_id())
+        return keys if keys is not None else self.add(song)
+
+    def check_guess(self, guess_id, answer_keys: tuple[int, int]) -> GuessVerdict:
+        """Compare the keys of a guessed song ID with the answer's"""
+        guess_keys = self.keys[guess_id]
+        return GuessVerdict(guess_keys[0] == answer_keys[0], guess_keys[1] == answer_keys[1])
@@ -0,0 +1,130 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from telegram import Bot
+from telegram.error import BadRequest, RetryAfter, TelegramError, Unauthorized
+from .metrics import metrics
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` acquisitions per second, with bursts up to `capacity`"""
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, returning how long to wait before using it"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self) -> None:
+        """Wait until a token is available"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+class BroadcastReport:
+    """Outcome of one broadcast"""
+    def __init__(self, total: int) -> None:
+        self.total = total
+        self.sent = 0
+        self.failed: dict[int, str] = {}
+        self.retries = 0
+        self.start_time = time.monotonic()
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+
+    def get_throughput(self) -> float:
+        """Messages sent per second"""
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.sent}/{self.total} sent, {len(self.failed)} failed, {self.retries} retries "
+            f"in {self.elapsed:.1f} s ({self.get_throughput():.1f} messages/s)"
+        )
+
+class Broadcaster:
+    """
+    Send one message to many chats through a pool of worker threads.
+    A global token bucket and one bucket per chat keep sends within Telegram's
+    rate limits (about 30 messages/s overall and 1 message/s per chat).
+    Sends are retried on 429 (after the delay Telegram asks for) and on
+    transient errors (with exponential backoff); blocked or invalid chats fail at once
+    """
+    def __init__(self, bot: Bot, workers=8, global_rate=30.0, chat_rate=1.0, max_retries=5, backoff=1.0) -> None:
+        self.bot = bot
+        self.workers = workers
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_buckets: dict[int, TokenBucket] = {}
+        self.chat_buckets_lock = threading.Lock()
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def get_chat_bucket(self, chat_id) -> TokenBucket:
+        """Get the rate limiter for one chat"""
+        with self.chat_buckets_lock:
+            if chat_id not in self.chat_buckets:
+                self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, capacity=1)
+            return self.chat_buckets[chat_id]
+
+    def send(self, chat_id, report: BroadcastReport, **kwargs) -> None:
+        """Send to one chat, retrying as needed"""
+        for attempt in range(self.max_retries + 1):
+            self.get_chat_bucket(chat_id).acquire()
+            self.global_bucket.acquire()
+            try:
+                with metrics.timer('broadcast_send'):
+                    self.bot.send_message(chat_id=chat_id, **kwargs)
+            except RetryAfter as e:
+                delay = e.retry_after
+                error = e
+            except (Unauthorized, BadRequest) as e:
+                # Bot blocked, chat gone or bad message: retrying won't help
+                with report.lock:
+                    report.failed[chat_id] = str(e)
+                logging.warning(f"Broadcast to {chat_id} failed: {e}")
+                return
+            except TelegramError as e:
+                delay = self.backoff * 2**attempt
+                error = e
+            except Exception as e:
+                with report.lock:
+                    report.failed[chat_id] = str(e)
+                logging.exception(f"Broadcast to {chat_id} failed")
+                return
+            else:
+                with report.lock:
+                    report.sent += 1
+                return
+            if attempt < self.max_retries:
+                with report.lock:
+                    report.retries += 1
+                logging.info(f"Broadcast to {chat_id} failed ({error}), retrying in {delay} s")
+                time.sleep(delay)
+        with report.lock:
+            report.failed[chat_id] = str(error)
+        logging.warning(f"Broadcast to {chat_id} failed after {self.max_retries} retries: {error}")
+
+    def broadcast(self, chat_ids, progress_interval=5.0, **kwargs) -> BroadcastReport:
+        """Send a message (send_message keyword arguments) to all chats and wait until done"""
+        chat_ids = list(chat_ids)
+        report = BroadcastReport(len(chat_ids))
+        logging.info(f"Broadcasting to {len(chat_ids)} chats")
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="broadcast") as executor:
+            pending = {executor.submit(self.send, chat_id, report, **kwargs) for chat_id in chat_ids}
+            while pending:
+                _, pending = wait(pending, timeout=progress_interval)
+                if pending:
+                    logging.info(f"Broadcast progress: {report.sent + len(report.failed)}/{report.total}")
+        report.elapsed = time.monotonic() - report.start_time
+        logging.info(f"Broadcast done: {report}")
+        return report
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+class ClipCache:
+    """
+    Persistent on-disk cache of generated clips, keyed by song ID, clip durations and clip profile.
+    Entries are written to a temporary directory and renamed into place, and an
+    index file records each file's size and hash so damaged entries are dropped
+    instead of being served. Least recently used entries are evicted to stay
+    within `max_bytes`
+    """
+    index_file = 'index.json'
+
+    def __init__(self, cache_dir='clip_cache', max_bytes=500 * 2**20) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.entries: dict[str, dict] = self.load_index()
+
+    @staticmethod
+    def get_key(song_id, clip_durations, profile) -> str:
+        """Get the cache key for a song's clips"""
+        return f"{song_id}.{'-'.join(map(str, clip_durations))}.{profile}"
+
+    @staticmethod
+    def hash_file(path) -> str:
+        """Get the SHA-256 hash of a file"""
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as fh:
+            for block in iter(lambda: fh.read(2**16), b''):
+                sha256.update(block)
+        return sha256.hexdigest()
+
+    def get_entry_dir(self, key) -> str:
+        """Get the directory of a cache entry"""
+        return os.path.join(self.cache_dir, key)
+
+    def load_index(self) -> dict[str, dict]:
+        """Read the index, dropping entries whose directory is missing"""
+        index_path = os.path.join(self.cache_dir, self.index_file)
+        if not os.path.exists(index_path):
+            return {}
+        try:
+            with open(index_path) as index_fh:
+                entries = json.load(index_fh)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Clip cache index {index_path} unreadable ({e}), starting empty")
+            return {}
+        return {key: entry for key, entry in entries.items() if os.path.isdir(self.get_entry_dir(key))}
+
+    def save_index(self) -> None:
+        """Atomically write the index"""
+        index_path = os.path.join(self.cache_dir, self.index_file)
+        with open(index_path + '.tmp', 'w') as index_fh:
+            json.dump(self.entries, index_fh)
+            index_fh.flush()
+            os.fsync(index_fh.fileno())
+        os.replace(index_path + '.tmp', index_path)
+
+    def get_size(self) -> int:
+        """Get the total size of cached clips in bytes"""
+        return sum(entry['size'] for entry in self.entries.values())
+
+    def verify(self, key) -> bool:
+        """Check that all files of an entry exist with the recorded size and hash"""
+        entry_dir = self.get_entry_dir(key)
+        for filename, file_info in self.entries[key]['files'].items():
+            path = os.path.join(entry_dir, filename)
+            if not os.path.exists(path) or os.path.getsize(path) != file_info['size']:
+                return False
+            if self.hash_file(path) != file_info['sha256']:
+                return False
+        return True
+
+    def remove(self, key) -> None:
+        """Delete an entry (the index is saved by the caller)"""
+        self.entries.pop(key, None)
+        shutil.rmtree(self.get_entry_dir(key), ignore_errors=True)
+
+    def get(self, song_id, clip_durations, dest_dir, profile='mp3') -> bool:
+        """Copy a song's cached clips into dest_dir, returning whether they were cached"""
+        key = self.get_key(song_id, clip_durations, profile)
+        with self.lock:
+            if key not in self.entries:
+                return False
+            if not self.verify(key):
+                logging.warning(f"Clip cache entry {key} is damaged, removing it")
+                self.remove(key)
+                self.save_index()
+                return False
+            entry_dir = self.get_entry_dir(key)
+            for filename in self.entries[key]['files']:
+                dest = os.path.join(dest_dir, filename)
+                if os.path.exists(dest):
+                    os.remove(dest)
+                try:
+                    os.link(os.path.join(entry_dir, filename), dest)
+                except OSError:
+                    shutil.copy2(os.path.join(entry_dir, filename), dest)
+            self.entries[key]['last_used'] = time.time()
+            self.save_index()
+        logging.info(f"Clip cache hit for {key}")
+        return True
+
+    def put(self, song_id, clip_durations, clip_files: list[str], profile='mp3') -> None:
+        """Add a song's clips to the cache"""
+        key = self.get_key(song_id, clip_durations, profile)
+        entry_dir = self.get_entry_dir(key)
+        tmp_dir = entry_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        files = {}
+        for clip_file in clip_files:
+            filename = os.path.basename(clip_file)
+            shutil.copy2(clip_file, os.path.join(tmp_dir, filename))
+            files[filename] = {
+                'size': os.path.getsize(clip_file),
+                'sha256': self.hash_file(clip_file)
+            }
+        with self.lock:
+            self.remove(key)
+            os.replace(tmp_dir, entry_dir)
+            self.entries[key] = {
+                'files': files,
+                'size': sum(file_info['size'] for file_info in files.values()),
+                'last_used': time.time()
+            }
+            self.evict(keep=key)
+            self.save_index()
+        logging.info(f"Added {key} to clip cache ({self.entries[key]['size']} bytes)")
+
+    def evict(self, keep=None) -> None:
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        total = self.get_size()
+        for key in sorted(self.entries, key=lambda key: self.entries[key]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self.entries[key]['size']
+            logging.info(f"Evicting {key} from clip cache")
+            self.remove(key)
@@ -0,0 +1,74 @@
+import logging
+import os
+import threading
+from telegram import Bot, Message
+from telegram.error import BadRequest
+from .metrics import metrics
+
+class ClipDelivery:
+    """
+    Send the clips of a game, uploading each clip file to Telegram only once.
+    The file_id Telegram returns for an upload is reused for every later send
+    """
+    def __init__(self, clip_files: list[str], send_as='audio') -> None:
+        self.clip_files = clip_files
+        # 'audio' or 'voice'
+        self.send_as = send_as
+        self.file_ids: list[str | None] = [None] * len(clip_files)
+        # One lock per clip so concurrent first sends don't upload the same clip twice
+        self.locks = [threading.Lock() for _ in clip_files]
+        self.bytes_uploaded = 0
+        self.uploads = 0
+        self.cached_sends = 0
+
+    def get_stats(self) -> dict[str, int]:
+        """Get upload counters"""
+        return {
+            'uploads': self.uploads,
+            'bytes_uploaded': self.bytes_uploaded,
+            'cached_sends': self.cached_sends
+        }
+
+    def send(self, bot: Bot, chat_id: int, clip, **kwargs) -> Message:
+        """Send a clip file or file_id as audio or voice"""
+        if self.send_as == 'voice':
+            return bot.send_voice(chat_id, clip, **kwargs)
+        return bot.send_audio(chat_id, clip, **kwargs)
+
+    def upload_clip(self, bot: Bot, chat_id: int, clip_num: int, **kwargs) -> Message:
+        """Upload a clip file to a chat and remember its file_id"""
+        clip_file = self.clip_files[clip_num]
+        with open(clip_file, 'rb') as clip_fh, metrics.timer('clip_upload'):
+            message = self.send(bot, chat_id, clip_fh, **kwargs)
+        self.file_ids[clip_num] = message.effective_attachment.file_id
+        self.uploads += 1
+        self.bytes_uploaded += os.path.getsize(clip_file)
+        logging.info(f"Uploaded {clip_file} as {self.file_ids[clip_num]}")
+        return message
+
+    def upload_all(self, bot: Bot, chat_id: int) -> None:
+        """Upload all clips up front to a designated chat"""
+        logging.info(f"Uploading {len(self.clip_files)} clips to chat {chat_id}")
+        for clip_num in range(len(self.clip_files)):
+            with self.locks[clip_num]:
+                if self.file_ids[clip_num] is None:
+                    self.upload_clip(bot, chat_id, clip_num, caption=f"Clip #{clip_num + 1}")
+
+    def send_clip(self, bot: Bot, chat_id: int, clip_num: int, **kwargs) -> Message:
+        """Send a clip by file_id, falling back to uploading the file"""
+        file_id = self.file_ids[clip_num]
+        if file_id is not None:
+            try:
+                with metrics.timer('clip_send_cached'):
+                    message = self.send(bot, chat_id, file_id, **kwargs)
+                self.cached_sends += 1
+                return message
+            except BadRequest as e:
+                logging.warning(f"Sending clip #{clip_num + 1} by file_id failed ({e}), uploading again")
+        with self.locks[clip_num]:
+            if self.file_ids[clip_num] is not None and self.file_ids[clip_num] != file_id:
+                # Someone else uploaded it while we were waiting
+                message = self.send(bot, chat_id, self.file_ids[clip_num], **kwargs)
+                self.cached_sends += 1
+                return message
+            return self.upload_clip(bot, chat_id, clip_num, **kwargs)
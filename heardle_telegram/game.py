@@ -1,6 +1,9 @@
 import logging
+import threading
+from bisect import insort
 import time
 from prettytable import PrettyTable
+from .answer_keys import GuessVerdict
 
 class UserGame:
     """One user playing one game"""
@@ -49,16 +52,94 @@ class UserGame:
         return self.defeat or self.success
 
 class Game:
-    """One instance of a whole game, i.e. one song"""
-    def __init__(self, song, clip_generator, library) -> None:
-        self.start_time = time.strftime('%Y%m%d%H%M%S', time.gmtime())
+    """
+    One instance of a whole game, i.e. one song.
+    Players' moves change the game through `record`, which applies them as
+    events under a lock and appends them to the journal, if there is one
+    """
+    def __init__(self, song, clip_generator, library, start_time=None) -> None:
+        self.start_time = start_time or time.strftime('%Y%m%d%H%M%S', time.gmtime())
         self.song = song
         self.clip_generator = clip_generator
         self.library = library
+        # Canonical keys of the answer, so checking a guess needs no string work
+        self.answer_keys = library.answer_keys.get_keys(song)
         self.user_games: dict[int, UserGame] = {}
         self.scores: dict[int, int] = {}
+        # (score, finishing order, user ID), kept sorted as scores come in
+        self.leaderboard: list[tuple[int, int, int]] = []
+        # Rendered scoreboard, until the next score
+        self.scoreboard = None
+        self.lock = threading.RLock()
+        self.journal = None
+        # Cross-game player stats, if kept
+        self.stats = None
         logging.info(f"Launching game at {self.start_time}")
 
+    def record(self, event: dict) -> None:
+        """Apply a move and journal it"""
+        with self.lock:
+            self.apply_event(event)
+            if self.journal is not None:
+                self.journal.append(event)
+
+    def apply_event(self, event: dict) -> None:
+        """Change the game state for a move"""
+        if event['type'] == 'start':
+            self.user_games[event['user']['id']] = UserGame(event['user'], self.__hash__())
+        elif event['type'] == 'pass':
+            self.user_games[event['user_id']].pass_move()
+        elif event['type'] == 'success':
+            self.user_games[event['user_id']].set_success()
+        elif event['type'] == 'defeat':
+            self.user_games[event['user_id']].set_defeat()
+        elif event['type'] == 'score':
+            self.add_score(event['user_id'], event['score'])
+        else:
+            raise ValueError(f"Unknown game event {event['type']}")
+
+    def get_state(self) -> dict:
+        """Get the players' state, for snapshots"""
+        return {
+            'user_games': [
+                {
+                    'id': user_game.get_id(),
+                    'username': user_game.username,
+                    'guesses': user_game.guesses,
+                    'defeat': user_game.defeat,
+                    'success': user_game.success
+                }
+                for user_game in self.user_games.values()
+            ],
+            'scores': [[user_id, score] for user_id, score in self.scores.items()]
+        }
+
+    def set_state(self, state: dict) -> None:
+        """Restore the players' state from a snapshot"""
+        self.user_games = {}
+        for user_state in state['user_games']:
+            user_game = UserGame(user_state, self.__hash__())
+            user_game.guesses = user_state['guesses']
+            user_game.defeat = user_state['defeat']
+            user_game.success = user_state['success']
+            self.user_games[user_game.get_id()] = user_game
+        self.scores = {}
+        self.leaderboard = []
+        for user_id, score in state['scores']:
+            self.add_score(user_id, score)
+
+    def add_score(self, user_id, score) -> None:
+        """Put a final score on the leaderboard"""
+        if user_id in self.scores:
+            self.leaderboard = [entry for entry in self.leaderboard if entry[2] != user_id]
+        self.scores[user_id] = score
+        insort(self.leaderboard, (score, len(self.scores), user_id))
+        self.scoreboard = None
+
+    def get_game_id(self) -> str:
+        """Get an ID for this game that is stable across restarts"""
+        return f"{self.start_time}-{self.song.get_id()}"
+
     def __hash__(self):
         return hash(repr(self.song) + str(self.start_time))
 
@@ -68,12 +149,28 @@ class Game:
 
     def new_user_game(self, user) -> None:
         """Create a new user game"""
-        self.user_games[user['id']] = UserGame(user, self.__hash__())
+        self.record({'type': 'start', 'user': {'id': user['id'], 'username': user['username']}})
+
+    def pass_move(self, user_id) -> None:
+        """A user passes or guesses wrong"""
+        self.record({'type': 'pass', 'user_id': user_id})
+
+    def set_success(self, user_id) -> None:
+        """A user wins"""
+        self.record({'type': 'success', 'user_id': user_id})
+
+    def set_defeat(self, user_id) -> None:
+        """A user loses or gives up"""
+        self.record({'type': 'defeat', 'user_id': user_id})
 
     def get_clip_file(self, clip_num=None) -> str:
         """Get a specific clip of the song"""
         return self.clip_generator.get_clip_file(clip_num)
 
+    def get_clip_files(self) -> list[str]:
+        """Get all clips of the song, shortest first"""
+        return self.clip_generator.get_clip_files()
+
     def get_user_game(self, user_id) -> UserGame:
         """Get a specific user's game"""
         return self.user_games[user_id]
@@ -86,30 +183,30 @@ class Game:
         """Reveal the answer"""
         return (str(self.song), self.song.get_url())
 
-    def check_guess(self, guess) -> tuple[bool, bool]:
+    def check_guess(self, guess) -> GuessVerdict:
         """
         Check if a guess ID matches the solution
-        and return a pair of booleans for artist and title
+        and return whether the artist and the title are right
         """
-        guess_artist = self.library.get_artist_by_song_id(guess).lower()
-        guess_title = self.library.get_title_by_song_id(guess).lower()
-        return (
-            guess_artist == self.song.get_artist().lower(), 
-            guess_title == self.song.get_title().lower()
-        )
+        return self.library.answer_keys.check_guess(guess, self.answer_keys)
 
     def register_final_score(self, user_id, score) -> None:
         """Add a user's score to the scoreboard when they're finished"""
-        self.scores[user_id] = score
+        self.record({'type': 'score', 'user_id': user_id, 'score': score})
+        if self.stats is not None:
+            self.stats.record_result(self.get_game_id(), user_id, self.user_games[user_id].get_username(), score)
 
     def show_scoreboard(self) -> str:
         """Display scoreboard (at the end of a game).
         Unfortunately Telegram doesn't support markdown tables"""
-        scoreboard = PrettyTable()
-        scoreboard.field_names = ["User", "Score"]
-        for user_id in sorted(self.scores, key=self.scores.get):
-            scoreboard.add_row([
-                self.user_games[user_id].get_username(),
-                f"{self.scores[user_id] if self.scores[user_id] <= 6 else 'X'}/6"
-            ])
-        return scoreboard
+        with self.lock:
+            if self.scoreboard is None:
+                scoreboard = PrettyTable()
+                scoreboard.field_names = ["User", "Score"]
+                for score, _, user_id in self.leaderboard:
+                    scoreboard.add_row([
+                        self.user_games[user_id].get_username(),
+                        f"{score if score <= 6 else 'X'}/6"
+                    ])
+                self.scoreboard = scoreboard.get_string()
+            return self.scoreboard
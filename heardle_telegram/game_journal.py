@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import queue
+import threading
+
+class GameJournal:
+    """
+    Write-ahead journal of the current game's moves, with periodic snapshots.
+    Handlers only put events on a queue; a writer thread appends them to the
+    journal and fsyncs once per batch. Every `snapshot_interval` events the
+    whole game state is written to a snapshot file and the journal restarts
+    empty. Each event has a sequence number, so on recovery events already
+    included in the snapshot are skipped
+    """
+    def __init__(self, path='game_journal', snapshot_interval=1000) -> None:
+        self.path = path
+        self.snapshot_path = path + '.snapshot'
+        self.snapshot_interval = snapshot_interval
+        self.game = None
+        self.seq = 0
+        self.queue: queue.Queue[dict | None] = queue.Queue()
+        self.thread = None
+        self.journal_fh = None
+
+    @staticmethod
+    def get_header(game, song_dir, key=None, expires_at=None) -> dict:
+        """Describe a game well enough to find its song and clips again"""
+        return {
+            'key': key,
+            'expires_at': expires_at,
+            'song': {
+                'videoId': game.song.get_id(),
+                'title': game.song.get_title(),
+                'artists': [{'name': game.song.get_artist()}]
+            },
+            'start_time': game.start_time,
+            'song_dir': song_dir
+        }
+
+    def recover(self) -> dict | None:
+        """
+        Read the journalled game, if any.
+        Returns its header, the snapshot state and the events after the snapshot
+        """
+        if not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            with open(self.snapshot_path) as snapshot_fh:
+                snapshot = json.load(snapshot_fh)
+        except ValueError as e:
+            logging.warning(f"Game snapshot {self.snapshot_path} unreadable ({e})")
+            return None
+        events = []
+        if os.path.exists(self.path):
+            with open(self.path) as journal_fh:
+                for line in journal_fh:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # Torn write at the end of the journal
+                        break
+                    if event['seq'] > snapshot['seq']:
+                        events.append(event)
+        snapshot['events'] = events
+        return snapshot
+
+    def restore(self, game, recovered: dict) -> None:
+        """Bring a new game object up to the recovered state"""
+        game.set_state(recovered['state'])
+        for event in recovered['events']:
+            game.apply_event(event)
+        self.seq = recovered['events'][-1]['seq'] if recovered['events'] else recovered['seq']
+        logging.info(
+            f"Recovered game from {recovered['header']['start_time']} with {len(game.user_games)} players "
+            f"({len(recovered['events'])} journalled moves)"
+        )
+
+    def start(self, game, song_dir, key=None, expires_at=None) -> None:
+        """Start journalling a game, beginning with a snapshot of its current state"""
+        self.game = game
+        self.header = self.get_header(game, song_dir, key, expires_at)
+        with game.lock:
+            self.write_snapshot(self.seq, game.get_state())
+        self.journal_fh = open(self.path, 'w')
+        game.journal = self
+        self.thread = threading.Thread(target=self.run, name="game-journal", daemon=True)
+        self.thread.start()
+
+    def append(self, event: dict) -> None:
+        """Queue an event; called with the game lock held"""
+        self.seq += 1
+        self.queue.put(dict(event, seq=self.seq))
+
+    def write_snapshot(self, seq, state) -> None:
+        """Atomically write a snapshot of the game state"""
+        with open(self.snapshot_path + '.tmp', 'w') as snapshot_fh:
+            json.dump({'header': self.header, 'seq': seq, 'state': state}, snapshot_fh)
+            snapshot_fh.flush()
+            os.fsync(snapshot_fh.fileno())
+        os.replace(self.snapshot_path + '.tmp', self.snapshot_path)
+
+    def compact(self) -> None:
+        """Snapshot the game and empty the journal"""
+        with self.game.lock:
+            seq, state = self.seq, self.game.get_state()
+        self.write_snapshot(seq, state)
+        self.journal_fh.close()
+        self.journal_fh = open(self.path, 'w')
+
+    def run(self) -> None:
+        """Write queued events in batches"""
+        since_snapshot = 0
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            for event in batch:
+                if event is not None:
+                    self.journal_fh.write(json.dumps(event) + '\n')
+            self.journal_fh.flush()
+            os.fsync(self.journal_fh.fileno())
+            since_snapshot += len(batch)
+            if stop:
+                return
+            if since_snapshot >= self.snapshot_interval:
+                self.compact()
+                since_snapshot = 0
+
+    def close(self, finished=False) -> None:
+        """Stop journalling; a finished game's journal and snapshot are deleted"""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            self.journal_fh.close()
+            self.game.journal = None
+        if finished:
+            for path in (self.path, self.snapshot_path):
+                if os.path.exists(path):
+                    os.remove(path)
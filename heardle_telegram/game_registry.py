@@ -0,0 +1,149 @@
+import glob
+import logging
+import threading
+import time
+from .game import Game
+from .game_journal import GameJournal
+from .clip_delivery import ClipDelivery
+
+class GameEntry:
+    """One running game and what belongs to it"""
+    def __init__(self, key, game, clip_delivery, journal, expires_at=None) -> None:
+        self.key = key
+        self.game = game
+        self.clip_delivery = clip_delivery
+        self.journal = journal
+        # None for games that only end when the bot stops
+        self.expires_at = expires_at
+
+class GameRegistry:
+    """
+    All games running in this process, keyed by chat (or 'default' for the main round).
+    Games share the library and the song pipeline (and through it the clip cache);
+    each game has its own lock, journal and clip uploads. Players are tracked
+    to the game they last started, so their moves in private chat go to it
+    """
+    default_key = 'default'
+
+    def __init__(self, library, song_pipeline, journal_prefix='game_journal', stats=None) -> None:
+        self.library = library
+        # Where every game records players' final scores, if anywhere
+        self.stats = stats
+        self.song_pipeline = song_pipeline
+        self.journal_prefix = journal_prefix
+        self.games: dict[str, GameEntry] = {}
+        self.user_games: dict[int, str] = {}
+        # Keys of games being created, while their song is taken (or prepared)
+        self.creating: set[str] = set()
+        self.lock = threading.Lock()
+
+    def get_journal_path(self, key) -> str:
+        """Get the journal file of one game"""
+        return self.journal_prefix if key == self.default_key else f"{self.journal_prefix}-{key}"
+
+    def add(self, key, game, journal, expires_at=None) -> GameEntry:
+        """Register a game and start journalling it"""
+        journal.start(game, game.clip_generator.song_dir, key, expires_at)
+        game.stats = self.stats
+        entry = GameEntry(
+            key, game,
+            ClipDelivery(game.get_clip_files(), send_as=game.clip_generator.get_send_as()),
+            journal,
+            expires_at
+        )
+        with self.lock:
+            self.games[key] = entry
+            for user_id in game.get_played_users():
+                self.user_games.setdefault(user_id, key)
+        return entry
+
+    def create_game(self, key, ttl=None, if_absent=False) -> GameEntry | None:
+        """
+        Start a new game with the next prepared song.
+        With `if_absent`, return None instead if the key already has a game (or one being created)
+        """
+        with self.lock:
+            if if_absent and (key in self.games or key in self.creating):
+                return None
+            self.creating.add(key)
+        try:
+            song, clip_generator = self.song_pipeline.take_next()
+            game = Game(song, clip_generator, self.library)
+            logging.info(f"Created game {key}")
+            expires_at = time.time() + ttl if ttl is not None else None
+            return self.add(key, game, GameJournal(self.get_journal_path(key)), expires_at)
+        finally:
+            with self.lock:
+                self.creating.discard(key)
+
+    def recover_game(self, journal_path) -> GameEntry | None:
+        """Rebuild a game from its journal, if its clips are still there"""
+        journal = GameJournal(journal_path)
+        recovered = journal.recover()
+        if recovered is None:
+            return None
+        resumed = self.song_pipeline.resume(recovered['header']['song']['videoId'])
+        if resumed is None:
+            logging.warning(f"Clips for journalled game {journal_path} are gone, discarding it")
+            journal.close(finished=True)
+            return None
+        song, clip_generator = resumed
+        game = Game(song, clip_generator, self.library, start_time=recovered['header']['start_time'])
+        journal.restore(game, recovered)
+        key = recovered['header'].get('key') or self.default_key
+        return self.add(key, game, journal, recovered['header'].get('expires_at'))
+
+    def recover_all(self) -> list[GameEntry]:
+        """Rebuild all journalled games"""
+        paths = [self.journal_prefix] + glob.glob(f"{glob.escape(self.journal_prefix)}-*")
+        entries = []
+        for path in paths:
+            if path.endswith('.snapshot') or path.endswith('.tmp'):
+                continue
+            entry = self.recover_game(path)
+            if entry is not None:
+                entries.append(entry)
+        return entries
+
+    def get(self, key) -> GameEntry | None:
+        """Get a game by key"""
+        return self.games.get(key)
+
+    def get_for_chat(self, chat_id) -> GameEntry | None:
+        """Get the game played in a chat, falling back to the default game"""
+        return self.games.get(str(chat_id)) or self.games.get(self.default_key)
+
+    def get_for_user(self, user_id) -> GameEntry | None:
+        """Get the game a user is playing"""
+        key = self.user_games.get(user_id)
+        return self.games.get(key) if key is not None else None
+
+    def join(self, user_id, key) -> None:
+        """Make a game the one a user's moves go to"""
+        with self.lock:
+            self.user_games[user_id] = key
+
+    def end_game(self, key) -> GameEntry | None:
+        """Remove a game, delete its journal and release its song"""
+        with self.lock:
+            entry = self.games.pop(key, None)
+            if entry is None:
+                return None
+            for user_id in [user_id for user_id, user_key in self.user_games.items() if user_key == key]:
+                del self.user_games[user_id]
+        entry.journal.close(finished=True)
+        self.song_pipeline.release(entry.game.song)
+        logging.info(f"Ended game {key}")
+        return entry
+
+    def expire(self, now=None) -> list[GameEntry]:
+        """End all games past their expiry time"""
+        now = now if now is not None else time.time()
+        expired = [key for key, entry in list(self.games.items())
+                   if entry.expires_at is not None and entry.expires_at <= now]
+        return [entry for entry in map(self.end_game, expired) if entry is not None]
+
+    def close(self) -> None:
+        """Stop journalling all games, keeping them for recovery"""
+        for entry in list(self.games.values()):
+            entry.journal.close()
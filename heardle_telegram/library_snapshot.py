@@ -0,0 +1,136 @@
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from array import array
+from .process_song import Song
+from .song_index import SongIndex
+from .answer_keys import AnswerKeys
+
+class SnapshotPostings:
+    """One kind of posting table in a library snapshot, read from disk on first use of each n-gram"""
+    def __init__(self, snapshot, kind) -> None:
+        self.snapshot = snapshot
+        self.kind = kind
+        self.loaded: dict[str, array | None] = {}
+
+    def get(self, gram, default=None) -> array | None:
+        """Get the posting list for an n-gram"""
+        if gram not in self.loaded:
+            self.loaded[gram] = self.snapshot.read_posting(self.kind, gram)
+        posting = self.loaded[gram]
+        return default if posting is None else posting
+
+class LibrarySnapshot:
+    """
+    SQLite snapshot of a library, its prebuilt song index and its answer keys.
+    Loading a snapshot only reads the song columns (with each song's answer keys);
+    posting lists of the index are fetched as queries need them, so startup
+    doesn't parse the ytmusicapi payload, rebuild the index or normalise names
+    """
+    version = 2
+
+    def __init__(self, path) -> None:
+        self.path = path
+        self.connection = None
+        self.meta: dict[str, str] = {}
+        self.lock = threading.Lock()
+
+    def exists(self) -> bool:
+        """Check whether the snapshot file exists"""
+        return os.path.exists(self.path)
+
+    def is_newer_than(self, path) -> bool:
+        """Check whether the snapshot was written after another file was last changed"""
+        return self.exists() and (not os.path.exists(path) or os.path.getmtime(self.path) >= os.path.getmtime(path))
+
+    def write(self, songs: list[Song], index: SongIndex, answer_keys: AnswerKeys, answer_keys_fingerprint: str) -> None:
+        """Atomically write songs (in library order), their index and their answer keys"""
+        tmp_path = self.path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        connection = sqlite3.connect(tmp_path)
+        with connection:
+            connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            connection.execute(
+                "CREATE TABLE songs ("
+                "position INTEGER PRIMARY KEY, video_id TEXT, title TEXT, artist TEXT, artist_key INTEGER, title_key INTEGER)"
+            )
+            connection.execute(
+                "CREATE TABLE answer_key_ids (kind TEXT, name TEXT, id INTEGER, PRIMARY KEY (kind, name)) WITHOUT ROWID"
+            )
+            connection.execute(
+                "CREATE TABLE postings (kind TEXT, gram TEXT, positions BLOB, PRIMARY KEY (kind, gram)) WITHOUT ROWID"
+            )
+            connection.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ('version', str(self.version)),
+                ('byteorder', sys.byteorder),
+                ('songs', str(len(songs))),
+                ('answer_keys', answer_keys_fingerprint)
+            ])
+            connection.executemany(
+                "INSERT INTO songs VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (position, song.get_id(), song.get_title(), song.get_artist(), *answer_keys.get_keys(song))
+                    for position, song in enumerate(songs)
+                )
+            )
+            for kind, ids in (('artist', answer_keys.artist_ids), ('title', answer_keys.title_ids)):
+                connection.executemany("INSERT INTO answer_key_ids VALUES (?, ?, ?)", ((kind, name, id) for name, id in ids.items()))
+            for kind, postings in index.get_postings().items():
+                connection.executemany(
+                    "INSERT INTO postings VALUES (?, ?, ?)",
+                    ((kind, gram, posting.tobytes()) for gram, posting in postings.items())
+                )
+        connection.close()
+        os.replace(tmp_path, self.path)
+        logging.info(f"Wrote snapshot of {len(songs)} songs to {self.path}")
+
+    def open(self) -> bool:
+        """Open the snapshot for reading, returning whether it is usable"""
+        try:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            meta = dict(connection.execute("SELECT key, value FROM meta"))
+        except sqlite3.Error as e:
+            logging.warning(f"Cannot read snapshot {self.path} ({e})")
+            return False
+        if meta.get('version') != str(self.version) or meta.get('byteorder') != sys.byteorder:
+            logging.warning(f"Snapshot {self.path} has an incompatible format")
+            connection.close()
+            return False
+        self.connection = connection
+        self.meta = meta
+        return True
+
+    def read_posting(self, kind, gram) -> array | None:
+        """Read one posting list"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT positions FROM postings WHERE kind = ? AND gram = ?", (kind, gram)
+            ).fetchone()
+        if row is None:
+            return None
+        posting = array('I')
+        posting.frombytes(row[0])
+        return posting
+
+    def read(self) -> tuple[dict[str, Song], SongIndex, dict[str, tuple[int, int]]]:
+        """Read songs by ID, an index backed by the snapshot's posting lists, and songs' answer keys by ID"""
+        songs = {}
+        keys = {}
+        with self.lock:
+            rows = self.connection.execute("SELECT video_id, title, artist, artist_key, title_key FROM songs ORDER BY position")
+            for video_id, title, artist, artist_key, title_key in rows:
+                songs[video_id] = Song({'videoId': video_id, 'title': title, 'artists': [{'name': artist}]})
+                keys[video_id] = (artist_key, title_key)
+        postings = {kind: SnapshotPostings(self, kind) for kind in SongIndex.posting_kinds}
+        return songs, SongIndex(songs.values(), postings), keys
+
+    def read_answer_key_ids(self) -> tuple[dict[str, int], dict[str, int]]:
+        """Read the numbered canonical artist and title names"""
+        ids = {'artist': {}, 'title': {}}
+        with self.lock:
+            for kind, name, id in self.connection.execute("SELECT kind, name, id FROM answer_key_ids"):
+                ids[kind][name] = id
+        return ids['artist'], ids['title']
@@ -0,0 +1,200 @@
+import json
+import logging
+import os
+from typing import Iterator
+
+class YTMusicPager:
+    """
+    Pages of the user's library songs from YTMusic.
+    `YTMusic.get_library_songs` only returns whole lists, so this sends the
+    same requests one page at a time, and hands back the continuation for the
+    next page so a sync can resume from it.
+    Those requests go through ytmusicapi internals (as of the version pinned in
+    requirements.txt); if they have moved, the whole library is fetched with
+    `get_library_songs` as a single page instead, which can't be resumed
+    """
+    def __init__(self, ytmusic) -> None:
+        self.ytmusic = ytmusic
+        self.use_fallback = False
+
+    def get_page(self, order=None, continuation=None) -> tuple[list[dict], str | None]:
+        """Get a page of songs (the first, or the one after `continuation`) and the next page's continuation"""
+        if not self.use_fallback:
+            try:
+                return self.request_page(order, continuation)
+            except (ImportError, AttributeError) as e:
+                logging.warning(f"Cannot page through the library with this ytmusicapi ({e!r}), fetching it all at once")
+                self.use_fallback = True
+        # Songs already staged by an interrupted sync are fetched again, and dropped as duplicates when applied
+        return self.ytmusic.get_library_songs(limit=None, order=order), None
+
+    def request_page(self, order=None, continuation=None) -> tuple[list[dict], str | None]:
+        """Send one page's request the way get_library_songs does"""
+        from ytmusicapi.continuations import get_continuation_contents, get_continuation_params
+        from ytmusicapi.mixins._utils import prepare_order_params
+        from ytmusicapi.parsers.library import parse_library_songs
+        from ytmusicapi.parsers.playlists import parse_playlist_items
+        self.ytmusic._check_auth()
+        body = {'browseId': 'FEmusic_liked_videos'}
+        if order is not None:
+            body['params'] = prepare_order_params(order)
+        if continuation is None:
+            response = parse_library_songs(self.ytmusic._send_request('browse', body))
+            results = response['results']
+            songs = response['parsed'] or []
+        else:
+            response = self.ytmusic._send_request('browse', body, continuation)
+            if 'continuationContents' not in response:
+                return [], None
+            results = response['continuationContents']['musicShelfContinuation']
+            songs = get_continuation_contents(results, parse_playlist_items)
+        if not results or 'continuations' not in results:
+            return songs, None
+        return songs, get_continuation_params(results)
+
+class LibrarySync:
+    """
+    Incremental sync of the library cache from YTMusic.
+    Songs are appended to a staging file page by page, with a checkpoint after
+    each page holding the continuation of the next page, so an interrupted sync
+    resumes with the page it stopped at. Once all pages
+    are staged, the cache is diffed by videoId: songs still in the library keep
+    their entries and position, removed songs are dropped and new songs are
+    appended, and the new cache replaces the old one atomically
+    """
+    def __init__(self, cache='library_cache') -> None:
+        self.cache = cache
+        self.staging = cache + '.sync'
+        self.checkpoint = cache + '.sync.json'
+
+    def iter_pages(self, pager, order=None, continuation=None, started=False) -> Iterator[tuple[list[dict], str | None]]:
+        """
+        Get pages of library songs with the continuation of the page after each,
+        starting from the first page, or from `continuation` if already `started`
+        """
+        if started and continuation is None:
+            return
+        while True:
+            page, continuation = pager.get_page(order=order, continuation=continuation)
+            yield page, continuation
+            if continuation is None:
+                return
+
+    def read_cache_ids(self) -> set[str]:
+        """Get the videoIds in the current cache"""
+        if not os.path.exists(self.cache):
+            return set()
+        with open(self.cache) as cache_fh:
+            return {json.loads(line)['videoId'] for line in cache_fh if line.strip()}
+
+    def read_checkpoint(self) -> dict | None:
+        """Read the checkpoint of an interrupted sync"""
+        if not os.path.exists(self.checkpoint) or not os.path.exists(self.staging):
+            return None
+        try:
+            with open(self.checkpoint) as checkpoint_fh:
+                return json.load(checkpoint_fh)
+        except ValueError:
+            return None
+
+    def write_checkpoint(self, checkpoint: dict) -> None:
+        """Atomically write the checkpoint"""
+        with open(self.checkpoint + '.tmp', 'w') as checkpoint_fh:
+            json.dump(checkpoint, checkpoint_fh)
+        os.replace(self.checkpoint + '.tmp', self.checkpoint)
+
+    def truncate_staged(self, size) -> None:
+        """Drop anything staged after the last checkpoint, which will be fetched again"""
+        with open(self.staging, 'rb+') as staging_fh:
+            staging_fh.truncate(size)
+
+    def stage(self, pager, mode, order=None, known_ids=None) -> None:
+        """
+        Stage songs from YTMusic, resuming an interrupted sync of the same mode.
+        With `known_ids`, stop at the first song that is already known
+        """
+        checkpoint = self.read_checkpoint()
+        if checkpoint is not None and checkpoint['mode'] == mode and 'staged_bytes' in checkpoint:
+            self.truncate_staged(checkpoint['staged_bytes'])
+            logging.info(f"Resuming {mode} sync after {checkpoint['staged']} songs")
+        else:
+            open(self.staging, 'w').close()
+            checkpoint = {'mode': mode, 'staged': 0, 'staged_bytes': 0, 'pages': 0, 'continuation': None, 'complete': False}
+        if checkpoint['complete']:
+            return
+        with open(self.staging, 'a') as staging_fh:
+            pages = self.iter_pages(pager, order=order, continuation=checkpoint['continuation'], started=checkpoint['pages'] > 0)
+            for page, continuation in pages:
+                done = False
+                for song in page:
+                    if known_ids is not None and song['videoId'] in known_ids:
+                        done = True
+                        break
+                    json.dump(song, staging_fh)
+                    staging_fh.write('\n')
+                    checkpoint['staged'] += 1
+                staging_fh.flush()
+                os.fsync(staging_fh.fileno())
+                checkpoint['staged_bytes'] = staging_fh.tell()
+                checkpoint['pages'] += 1
+                checkpoint['continuation'] = continuation
+                self.write_checkpoint(checkpoint)
+                logging.info(f"Staged {checkpoint['staged']} songs")
+                if done:
+                    break
+        checkpoint['complete'] = True
+        self.write_checkpoint(checkpoint)
+
+    def apply(self, remove_missing=True, newest_first=False) -> tuple[int, int]:
+        """
+        Merge staged songs into the cache, returning the numbers of added and removed songs.
+        If songs were staged newest first, they are appended oldest first
+        """
+        staged_ids = set()
+        with open(self.staging) as staging_fh:
+            for line in staging_fh:
+                staged_ids.add(json.loads(line)['videoId'])
+        kept_ids = set()
+        removed = 0
+        tmp_cache = self.cache + '.tmp'
+        with open(tmp_cache, 'w') as tmp_fh:
+            if os.path.exists(self.cache):
+                with open(self.cache) as cache_fh:
+                    for line in cache_fh:
+                        if not line.strip():
+                            continue
+                        song_id = json.loads(line)['videoId']
+                        if remove_missing and song_id not in staged_ids:
+                            removed += 1
+                            continue
+                        kept_ids.add(song_id)
+                        tmp_fh.write(line if line.endswith('\n') else line + '\n')
+            added = 0
+            with open(self.staging) as staging_fh:
+                # Only additions are staged newest first, so there are few enough to reverse in memory
+                staged_lines = reversed(staging_fh.readlines()) if newest_first else staging_fh
+                for line in staged_lines:
+                    song_id = json.loads(line)['videoId']
+                    if song_id not in kept_ids:
+                        kept_ids.add(song_id)
+                        tmp_fh.write(line)
+                        added += 1
+            tmp_fh.flush()
+            os.fsync(tmp_fh.fileno())
+        os.replace(tmp_cache, self.cache)
+        os.remove(self.staging)
+        os.remove(self.checkpoint)
+        logging.info(f"Sync added {added} and removed {removed} songs; cache has {len(kept_ids)} songs")
+        return added, removed
+
+    def sync(self, pager) -> tuple[int, int]:
+        """Fetch the whole library and apply additions and removals to the cache"""
+        logging.info("Syncing cache with YTMusic")
+        self.stage(pager, 'full')
+        return self.apply(remove_missing=True)
+
+    def sync_additions(self, pager) -> tuple[int, int]:
+        """Fetch only songs added since the last sync, newest first, and append them to the cache"""
+        logging.info("Syncing new songs from YTMusic")
+        self.stage(pager, 'additions', order='recently_added', known_ids=self.read_cache_ids())
+        return self.apply(remove_missing=False, newest_first=True)
@@ -0,0 +1,203 @@
+import functools
+import json
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+class Histogram:
+    """
+    Latency histogram with logarithmic buckets, each about 10% wider than the last.
+    Recording a value is one log and one increment, and percentiles are read
+    from the buckets, so it is cheap enough to time every update
+    """
+    growth = 1.1
+    # Values (in seconds) below this all go in the first bucket
+    minimum = 1e-5
+
+    def __init__(self) -> None:
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, value: float) -> None:
+        """Add one value"""
+        bucket = int(math.log(value / self.minimum, self.growth)) if value > self.minimum else 0
+        with self.lock:
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+            self.count += 1
+            self.total += value
+            self.maximum = max(self.maximum, value)
+
+    def get_percentile(self, percentile: float) -> float:
+        """Estimate a percentile from the upper edge of the bucket it falls in"""
+        with self.lock:
+            if self.count == 0:
+                return 0.0
+            rank = percentile / 100 * self.count
+            seen = 0
+            for bucket in sorted(self.buckets):
+                seen += self.buckets[bucket]
+                if seen >= rank:
+                    return min(self.minimum * self.growth ** (bucket + 1), self.maximum)
+            return self.maximum
+
+    def get_summary(self) -> dict[str, float]:
+        """Get count, mean and percentiles in seconds"""
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.get_percentile(50),
+            'p95': self.get_percentile(95),
+            'p99': self.get_percentile(99),
+            'max': self.maximum
+        }
+
+class Metrics:
+    """
+    In-process counters and latency histograms, plus gauges read from other
+    components (e.g. queue lengths) when metrics are exported
+    """
+    def __init__(self) -> None:
+        self.counters: dict[str, int] = {}
+        self.histograms: dict[str, Histogram] = {}
+        self.gauges: dict[str, Callable[[], float]] = {}
+        self.lock = threading.Lock()
+
+    def increment(self, name, count=1) -> None:
+        """Add to a counter"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def get_histogram(self, name) -> Histogram:
+        """Get a histogram, creating it on first use"""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, name, seconds) -> None:
+        """Record a duration"""
+        self.get_histogram(name).record(seconds)
+
+    def add_gauge(self, name, read: Callable[[], float]) -> None:
+        """Register a function giving the current value of something"""
+        self.gauges[name] = read
+
+    @contextmanager
+    def timer(self, name):
+        """Time a block of code; failures are counted separately as `name`_errors"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.increment(f"{name}_errors")
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start_time)
+
+    def timed(self, name) -> Callable:
+        """Decorator timing every call of a function"""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def get_snapshot(self) -> dict:
+        """Get all counters, histogram summaries and gauges"""
+        gauges = {}
+        for name, read in list(self.gauges.items()):
+            try:
+                gauges[name] = read()
+            except Exception:
+                logging.exception(f"Failed to read gauge {name}")
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = dict(self.histograms)
+        return {
+            'counters': counters,
+            'histograms': {name: histogram.get_summary() for name, histogram in histograms.items()},
+            'gauges': gauges
+        }
+
+    def format_summary(self) -> str:
+        """Format a one-line-per-metric summary for the log"""
+        snapshot = self.get_snapshot()
+        lines = [
+            f"{name}: n={summary['count']} p50={summary['p50'] * 1000:.1f}ms "
+            f"p95={summary['p95'] * 1000:.1f}ms p99={summary['p99'] * 1000:.1f}ms max={summary['max'] * 1000:.1f}ms"
+            for name, summary in sorted(snapshot['histograms'].items())
+        ]
+        lines += [f"{name}: {value}" for name, value in sorted(snapshot['counters'].items())]
+        lines += [f"{name}: {value}" for name, value in sorted(snapshot['gauges'].items())]
+        return '\n'.join(lines)
+
+    def format_prometheus(self) -> str:
+        """Format all metrics in the Prometheus text format"""
+        snapshot = self.get_snapshot()
+        lines = []
+        for name, summary in sorted(snapshot['histograms'].items()):
+            lines.append(f"# TYPE heardle_{name}_seconds summary")
+            for quantile in ('p50', 'p95', 'p99'):
+                lines.append(f'heardle_{name}_seconds{{quantile="0.{quantile[1:]}"}} {summary[quantile]:.6f}')
+            lines.append(f"heardle_{name}_seconds_sum {summary['mean'] * summary['count']:.6f}")
+            lines.append(f"heardle_{name}_seconds_count {summary['count']}")
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f"# TYPE heardle_{name}_total counter")
+            lines.append(f"heardle_{name}_total {value}")
+        for name, value in sorted(snapshot['gauges'].items()):
+            lines.append(f"# TYPE heardle_{name} gauge")
+            lines.append(f"heardle_{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+class MetricsServer:
+    """
+    Local HTTP endpoint for metrics: /metrics in the Prometheus text format,
+    /metrics.json as JSON
+    """
+    def __init__(self, metrics: Metrics, port, host='127.0.0.1') -> None:
+        self.metrics = metrics
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path == '/metrics':
+                    body, content_type = metrics.format_prometheus(), 'text/plain; version=0.0.4'
+                elif handler.path == '/metrics.json':
+                    body, content_type = json.dumps(metrics.get_snapshot()), 'application/json'
+                else:
+                    handler.send_error(404)
+                    return
+                handler.send_response(200)
+                handler.send_header('Content-Type', content_type)
+                handler.end_headers()
+                handler.wfile.write(body.encode())
+
+            def log_message(handler, format, *args):
+                # Scrapes would otherwise flood the log
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.thread = None
+
+    def start(self) -> None:
+        """Serve metrics in a background thread"""
+        logging.info(f"Serving metrics on http://{self.server.server_address[0]}:{self.server.server_address[1]}/metrics")
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stop serving metrics"""
+        self.server.shutdown()
+        self.server.server_close()
+
+# Shared by handlers and pipeline stages across the process
+metrics = Metrics()
@@ -0,0 +1,83 @@
+"""
+Silence and loudness detection on the raw sample buffer of an AudioSegment.
+These work on a NumPy view of the PCM data and compute the RMS of every window
+in one vectorised pass, instead of slicing 10 ms AudioSegments one at a time.
+Thresholds and window sizes mean the same as in pydub.silence
+"""
+import numpy as np
+from pydub import AudioSegment
+
+SAMPLE_TYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+def get_samples(sound: AudioSegment) -> np.ndarray:
+    """View the raw samples of a sound as a (frames, channels) array without copying"""
+    samples = np.frombuffer(sound.raw_data, dtype=SAMPLE_TYPES[sound.sample_width])
+    return samples.reshape(-1, sound.channels)
+
+def get_window_energy(samples: np.ndarray, window_frames: int) -> np.ndarray:
+    """Get the mean square sample value of each whole window"""
+    n_windows = len(samples) // window_frames
+    windows = samples[:n_windows * window_frames].reshape(n_windows, -1)
+    # einsum squares and sums each window without materialising the squares
+    return np.einsum('ij,ij->i', windows, windows, dtype=np.float64) / windows.shape[1]
+
+def find_first_loud_window(samples: np.ndarray, window_frames: int, silence_energy: float, block_windows=200) -> int | None:
+    """
+    Get the index of the first whole window at or above the silence threshold.
+    Windows are processed in blocks so a short intro doesn't cost a pass over the whole sound
+    """
+    n_windows = len(samples) // window_frames
+    for block_start in range(0, n_windows, block_windows):
+        block = samples[block_start * window_frames:min(block_start + block_windows, n_windows) * window_frames]
+        loud = np.flatnonzero(get_window_energy(block, window_frames) >= silence_energy)
+        if len(loud) > 0:
+            return block_start + int(loud[0])
+    return None
+
+def get_silence_energy(sound: AudioSegment, silence_threshold: float) -> float:
+    """Get the mean square sample value corresponding to a dBFS threshold"""
+    return (sound.max_possible_amplitude * 10 ** (silence_threshold / 20)) ** 2
+
+def is_silent(samples: np.ndarray, silence_energy: float) -> bool:
+    """Check if a (partial) window is below the silence threshold"""
+    return len(samples) == 0 or np.mean(np.square(samples, dtype=np.float64)) < silence_energy
+
+def detect_leading_silence(sound: AudioSegment, silence_threshold=-50.0, chunk_size=10) -> int:
+    """Get the length of silence at the start of a sound in ms"""
+    samples = get_samples(sound)
+    window_frames = int(sound.frame_rate * chunk_size / 1000)
+    silence_energy = get_silence_energy(sound, silence_threshold)
+    first_loud = find_first_loud_window(samples, window_frames, silence_energy)
+    if first_loud is not None:
+        return first_loud * chunk_size
+    # Every whole window is silent; check the partial one at the end
+    n_whole = len(samples) // window_frames
+    if not is_silent(samples[n_whole * window_frames:], silence_energy):
+        return n_whole * chunk_size
+    return len(sound)
+
+def detect_trailing_silence(sound: AudioSegment, silence_threshold=-50.0, chunk_size=10) -> int:
+    """Get the length of silence at the end of a sound in ms"""
+    samples = get_samples(sound)
+    window_frames = int(sound.frame_rate * chunk_size / 1000)
+    silence_energy = get_silence_energy(sound, silence_threshold)
+    # Reversing the view aligns windows with the end of the sound
+    n_whole = len(samples) // window_frames
+    first_loud = find_first_loud_window(samples[::-1], window_frames, silence_energy)
+    if first_loud is not None:
+        return first_loud * chunk_size
+    if not is_silent(samples[:len(samples) - n_whole * window_frames], silence_energy):
+        return n_whole * chunk_size
+    return len(sound)
+
+def find_loudest_section(sound: AudioSegment, duration: int, chunk_size=10) -> int:
+    """Get the start in ms of the `duration` ms section with the highest RMS"""
+    samples = get_samples(sound)
+    window_frames = int(sound.frame_rate * chunk_size / 1000)
+    energy = get_window_energy(samples, window_frames)
+    n_section = max(1, duration // chunk_size)
+    if len(energy) <= n_section:
+        return 0
+    cumulative = np.concatenate(([0.0], np.cumsum(energy)))
+    section_energy = cumulative[n_section:] - cumulative[:-n_section]
+    return int(np.argmax(section_energy)) * chunk_size
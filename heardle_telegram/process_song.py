@@ -1,14 +1,21 @@
 import os
 import logging
-import youtube_dl
-from pydub import AudioSegment, silence
+import re
+import resource
+import subprocess
+import sys
+import time
+from .metrics import metrics
 
 class Song:
+    # No per-instance __dict__; libraries hold tens of thousands of these
+    __slots__ = ('title', 'artist', 'id')
+
     def __init__(self, song_info: dict):
         self.title = song_info['title']
-        self.artist = song_info['artists'][0]['name']
+        # Artists repeat across songs, so share one string per artist
+        self.artist = sys.intern(song_info['artists'][0]['name'])
         self.id = song_info['videoId']
-        self.url = f"https://music.youtube.com/watch?v={self.id}"
 
     def get_id(self) -> str:
         """Get the unique ID for song"""
@@ -16,7 +23,7 @@ class Song:
 
     def get_url(self) -> str:
         """Get Youtube Music URL for song"""
-        return self.url
+        return f"https://music.youtube.com/watch?v={self.id}"
 
     def get_artist(self) -> str:
         """Get the artist"""
@@ -32,58 +39,161 @@ class Song:
     def __repr__(self):
         return f"Song: {self.title}; Artist: {self.artist}; ID: {self.id}"
 
-class ClipGenerator:
-    song_dir = 'song_clips'
-    full_song = os.path.join(song_dir, 'song_full.mp3')
-
-    dl_opts = {
-        'format': 'bestaudio',
-        'outtmpl': os.path.join(song_dir, 'song_full.%(ext)s'),
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '192',
-        }],
-        'rm_cachedir': True
-    }
+class SongUnavailable(Exception):
+    """A song that can't be downloaded or decoded, as opposed to a failure that may not happen again"""
 
+class ClipGenerator:
     clip_durations = [1, 2, 3, 5, 10, 20]
+    # Output formats for clips: ffmpeg output options, and whether Telegram
+    # should get them as audio or voice messages (voice needs OGG/Opus)
+    clip_profiles = {
+        'mp3': {'extension': 'mp3', 'options': ['-f', 'mp3'], 'send_as': 'audio'},
+        'mp3-64k': {'extension': 'mp3', 'options': ['-f', 'mp3', '-b:a', '64k'], 'send_as': 'audio'},
+        'opus': {'extension': 'ogg', 'options': ['-f', 'ogg', '-c:a', 'libopus', '-b:a', '48k'], 'send_as': 'voice'},
+        'opus-24k': {
+            'extension': 'ogg',
+            'options': ['-f', 'ogg', '-c:a', 'libopus', '-b:a', '24k', '-ac', '1'],
+            'send_as': 'voice'
+        }
+    }
+    # Seconds decoded from the start of the song to look for leading silence
+    silence_window = 30
+    # youtube_dl errors about the video itself rather than the connection
+    unavailable_errors = re.compile(
+        r"unavailable|not available|in your country|private video|has been removed|blocked|copyright|confirm your age",
+        re.IGNORECASE
+    )
+    frame_rate = 44100
+    channels = 2
 
-    def __init__(self):
+    def __init__(self, song_dir='song_clips', clean=True, clip_cache=None, profile='mp3'):
+        self.song_dir = song_dir
+        self.profile = profile
+        self.clip_cache = clip_cache
+        self.stage_times: dict[str, float] = {}
+        self.full_song = os.path.join(song_dir, 'song_full.mp3')
+        self.dl_opts = {
+            'format': 'bestaudio',
+            'outtmpl': os.path.join(song_dir, 'song_full.%(ext)s'),
+            'postprocessors': [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'mp3',
+                'preferredquality': '192',
+            }],
+            'rm_cachedir': True
+        }
         if os.path.exists(self.song_dir):
-            logging.info(f"Emptying directory {self.song_dir}")
-            for filename in os.listdir(self.song_dir):
-                os.remove(os.path.join(self.song_dir, filename))
+            if clean:
+                logging.info(f"Emptying directory {self.song_dir}")
+                for filename in os.listdir(self.song_dir):
+                    os.remove(os.path.join(self.song_dir, filename))
         # Create the song_clips directory
-        elif not os.path.exists(self.song_dir):
+        else:
             logging.info(f"Creating directory {self.song_dir}")
-            os.mkdir(self.song_dir)
+            os.makedirs(self.song_dir)
 
     def download_song(self, song):
         """Download a song from Youtube Music"""
-        with youtube_dl.YoutubeDL(self.dl_opts) as ydl:
-            ydl.download([song.get_url()])
+        # Only needed to prepare songs, so not loaded just to serve a prepared game
+        import youtube_dl
+        try:
+            with youtube_dl.YoutubeDL(self.dl_opts) as ydl:
+                ydl.download([song.get_url()])
+        except youtube_dl.utils.DownloadError as e:
+            if self.unavailable_errors.search(str(e)):
+                raise SongUnavailable(str(e)) from e
+            raise
+
+    def decode_window(self, duration):
+        """Decode only the first `duration` seconds of the full song"""
+        from pydub import AudioSegment
+        command = [
+            AudioSegment.converter, '-loglevel', 'error', '-nostdin',
+            '-t', str(duration), '-i', self.full_song,
+            '-f', 's16le', '-ac', str(self.channels), '-ar', str(self.frame_rate), '-'
+        ]
+        try:
+            pcm = subprocess.run(command, check=True, capture_output=True).stdout
+        except subprocess.CalledProcessError as e:
+            # A negative return code means ffmpeg was killed, which says nothing about the song
+            if e.returncode > 0:
+                raise SongUnavailable(f"Cannot decode {self.full_song}: {e.stderr.decode(errors='replace').strip()}") from e
+            raise
+        return AudioSegment(data=pcm, sample_width=2, frame_rate=self.frame_rate, channels=self.channels)
+
+    def find_leading_silence(self):
+        """Find the end of leading silence in ms, decoding more only if the whole window is silent"""
+        from .pcm_silence import detect_leading_silence
+        window = self.silence_window
+        while True:
+            audio = self.decode_window(window)
+            leading_silence_end = detect_leading_silence(audio)
+            if leading_silence_end < len(audio) or len(audio) < window * 1000:
+                return leading_silence_end
+            window *= 2
+
+    def encode_clips(self, start_ms, clip_nums=None):
+        """Encode all (or some) clips from one decode of the song in a single ffmpeg run"""
+        from pydub import AudioSegment
+        if clip_nums is None:
+            clip_nums = range(len(self.clip_durations))
+        command = [
+            AudioSegment.converter, '-y', '-loglevel', 'error', '-nostdin',
+            '-ss', f"{start_ms / 1000:.3f}", '-t', str(max(self.clip_durations)), '-i', self.full_song
+        ]
+        for clip_num in clip_nums:
+            command += ['-t', str(self.clip_durations[clip_num])]
+            command += self.clip_profiles[self.profile]['options']
+            command.append(self.get_clip_file(clip_num))
+        subprocess.run(command, check=True, capture_output=True)
 
     def generate_clips(self):
         """Generate shorter clips from the full song"""
-        full_song = AudioSegment.from_mp3(self.full_song)
-        logging.info(f"Full song length: {full_song.duration_seconds}")
-        leading_silence_end = silence.detect_leading_silence(full_song)
+        stage_start = time.perf_counter()
+        leading_silence_end = self.find_leading_silence()
+        self.stage_times['silence'] = time.perf_counter() - stage_start
         logging.info(f"Trimming {leading_silence_end} ms of silence from beginning")
-        full_song = full_song[leading_silence_end:]
-        logging.info(f"Generating clips of lengths (in seconds): {','.join(map(str, self.clip_durations))}")
-        for l in self.clip_durations:
-            clip = full_song[:l*1000]
-            clip.export(os.path.join(self.song_dir, f"clip_{l:d}s.mp3"), format='mp3')
+        logging.info(f"Generating {self.profile} clips of lengths (in seconds): {','.join(map(str, self.clip_durations))}")
+        stage_start = time.perf_counter()
+        self.encode_clips(leading_silence_end)
+        self.stage_times['encode'] = time.perf_counter() - stage_start
 
     def prepare_song(self, song):
         """Download song and generate clips to prepare a new game"""
+        self.stage_times = {}
+        if self.clip_cache is not None and self.clip_cache.get(song.get_id(), self.clip_durations, self.song_dir, self.profile):
+            logging.info(f"Using cached clips for {song}")
+            return
+        stage_start = time.perf_counter()
         self.download_song(song)
+        self.stage_times['download'] = time.perf_counter() - stage_start
         self.generate_clips()
+        if self.clip_cache is not None:
+            self.clip_cache.put(song.get_id(), self.clip_durations, self.get_clip_files(), self.profile)
+        self.log_stage_times()
+
+    def log_stage_times(self):
+        """Log time taken by each stage and peak memory use"""
+        stages = ', '.join(f"{stage} {seconds:.2f} s" for stage, seconds in self.stage_times.items())
+        for stage, seconds in self.stage_times.items():
+            metrics.observe(f"prepare_{stage}", seconds)
+        # ru_maxrss is in KB on Linux
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+        peak_child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // 1024
+        logging.info(f"Clip preparation: {stages}; peak RSS {peak_rss} MB (ffmpeg {peak_child_rss} MB)")
+
+    def get_send_as(self):
+        """Get whether clips should be sent as audio or voice messages"""
+        return self.clip_profiles[self.profile]['send_as']
+
+    def get_clip_files(self):
+        """Get all clips of the song, shortest first"""
+        return [self.get_clip_file(clip_num) for clip_num in range(len(self.clip_durations))]
 
     def get_clip_file(self, clip_num=None):
         """Get a specific clip of the song"""
         if clip_num is not None and clip_num < len(self.clip_durations):
-            return os.path.join(self.song_dir, f"clip_{self.clip_durations[clip_num]:d}s.mp3")
+            extension = self.clip_profiles[self.profile]['extension']
+            return os.path.join(self.song_dir, f"clip_{self.clip_durations[clip_num]:d}s.{extension}")
         else:
             return self.full_song
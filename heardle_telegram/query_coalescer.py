@@ -0,0 +1,63 @@
+import threading
+import time
+from typing import Callable
+from telegram import InlineQuery, Update
+from telegram.ext import JobQueue
+
+class InlineQueryCoalescer:
+    """
+    Answer only the latest inline query from each user.
+    Players send a new query with every character they type, so by the time an
+    older query is handled a newer one has often arrived and the client will
+    discard the older answer anyway. Arrivals are noted as updates come in;
+    a query is dropped without computing it once a newer one from the same user
+    has arrived, and a query younger than `delay` is answered from the job queue
+    after the delay (if still the latest) instead of holding up the update worker
+    """
+    def __init__(self, delay=0.04) -> None:
+        self.delay = delay
+        # User ID -> (ID of their latest inline query, when it arrived)
+        self.latest: dict[int, tuple[str, float]] = {}
+        self.lock = threading.Lock()
+        self.received = 0
+        self.answered = 0
+        self.dropped = 0
+
+    def note(self, update: Update) -> None:
+        """Record the arrival of an update, if it is an inline query"""
+        if update.inline_query is not None:
+            with self.lock:
+                self.latest[update.inline_query.from_user.id] = (update.inline_query.id, time.monotonic())
+                self.received += 1
+
+    def is_latest(self, inline_query: InlineQuery) -> bool:
+        """Check whether no newer query from the same user has arrived"""
+        latest = self.latest.get(inline_query.from_user.id)
+        return latest is None or latest[0] == inline_query.id
+
+    def submit(self, inline_query: InlineQuery, answer: Callable[[], None], job_queue: JobQueue) -> None:
+        """Answer a query now, after the debounce delay, or not at all if it is superseded"""
+        latest = self.latest.get(inline_query.from_user.id)
+        wait = latest[1] + self.delay - time.monotonic() if latest is not None and latest[0] == inline_query.id else 0
+        if wait > 0:
+            job_queue.run_once(lambda context: self.finish(inline_query, answer), wait)
+        else:
+            self.finish(inline_query, answer)
+
+    def finish(self, inline_query: InlineQuery, answer: Callable[[], None]) -> None:
+        """Answer a query if it is still the user's latest"""
+        with self.lock:
+            if not self.is_latest(inline_query):
+                self.dropped += 1
+                return
+            self.latest.pop(inline_query.from_user.id, None)
+            self.answered += 1
+        answer()
+
+    def get_stats(self) -> dict[str, int]:
+        """Get counts of queries received, answered and dropped as superseded"""
+        return {
+            'received': self.received,
+            'answered': self.answered,
+            'dropped': self.dropped
+        }
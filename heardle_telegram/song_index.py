@@ -0,0 +1,217 @@
+import heapq
+import itertools
+from array import array
+from collections import defaultdict
+from typing import Iterable, Iterator
+
+class SongIndex:
+    """
+    N-gram index over normalised "artist; title" keys of songs.
+    Every 1-, 2- and 3-character substring of a key maps to a sorted posting
+    list of song positions, so a substring query only has to verify the songs
+    in its rarest n-gram's posting list instead of scanning the whole library.
+    Smaller posting lists of n-grams at the start of the artist/title and at
+    word boundaries let ranking find the best matches without scoring every hit
+    """
+    gram_size = 3
+    # Names of the posting tables, as stored in library snapshots
+    posting_kinds = ('substring', 'prefix', 'boundary', 'exact')
+
+    def __init__(self, songs: Iterable, postings: dict | None = None) -> None:
+        """
+        Index songs, or use prebuilt posting tables (e.g. from a library snapshot)
+        given as a dict of posting kind to a mapping with a `get` method
+        """
+        self.songs = list(songs)
+        self.keys = [self.normalise(str(song)) for song in self.songs]
+        # Where the title starts in each key, after "artist; "
+        self.title_offsets = array('I', (len(self.normalise(song.get_artist())) + 2 for song in self.songs))
+        if postings is None:
+            postings = self.build_postings()
+        self.postings = postings['substring']
+        self.prefix_postings = postings['prefix']
+        self.boundary_postings = postings['boundary']
+        self.exact = postings['exact']
+
+    def build_postings(self) -> dict[str, dict[str, array]]:
+        """Build all posting tables from the keys"""
+        postings = defaultdict(lambda: array('I'))
+        prefix_postings = defaultdict(lambda: array('I'))
+        boundary_postings = defaultdict(lambda: array('I'))
+        exact = defaultdict(lambda: array('I'))
+        for position, key in enumerate(self.keys):
+            title_offset = self.title_offsets[position]
+            # Positions are appended in increasing order, so postings stay sorted
+            for gram in self.get_grams(key):
+                postings[gram].append(position)
+            for gram in self.get_grams(key, starts=(0, title_offset)):
+                prefix_postings[gram].append(position)
+            for gram in self.get_grams(key, starts=self.get_boundaries(key)):
+                boundary_postings[gram].append(position)
+            for exact_key in {key, key[:title_offset - 2], key[title_offset:]}:
+                exact[exact_key].append(position)
+        return {
+            'substring': dict(postings),
+            'prefix': dict(prefix_postings),
+            'boundary': dict(boundary_postings),
+            'exact': dict(exact)
+        }
+
+    def get_postings(self) -> dict:
+        """Get all posting tables by kind"""
+        return {
+            'substring': self.postings,
+            'prefix': self.prefix_postings,
+            'boundary': self.boundary_postings,
+            'exact': self.exact
+        }
+
+    def __len__(self) -> int:
+        return len(self.songs)
+
+    @staticmethod
+    def normalise(text: str) -> str:
+        """Normalise a key or query for matching"""
+        return text.lower()
+
+    @staticmethod
+    def is_boundary(key: str, i: int) -> bool:
+        """Check if position i of a key starts a word"""
+        return i == 0 or not key[i - 1].isalnum()
+
+    @classmethod
+    def get_boundaries(cls, key: str) -> list[int]:
+        """Get all positions of a key that start a word"""
+        return [i for i in range(len(key)) if cls.is_boundary(key, i)]
+
+    @classmethod
+    def get_grams(cls, key: str, starts: Iterable[int] | None = None) -> set[str]:
+        """Get all distinct substrings of a key up to the gram size, optionally only from some start positions"""
+        if starts is None:
+            starts = range(len(key))
+        return {
+            key[i:i + n]
+            for n in range(1, cls.gram_size + 1)
+            for i in starts
+            if i + n <= len(key)
+        }
+
+    def get_candidates(self, query: str, first_postings: dict | None = None) -> array:
+        """
+        Get the smallest posting list that all matches must be in.
+        With `first_postings`, matches must also start with that table's n-gram
+        """
+        if first_postings is None:
+            first_postings = self.postings
+        if len(query) <= self.gram_size:
+            return first_postings.get(query, array('I'))
+        rarest = first_postings.get(query[:self.gram_size], array('I'))
+        for i in range(len(query) - self.gram_size + 1):
+            posting = self.postings.get(query[i:i + self.gram_size], array('I'))
+            if len(posting) < len(rarest):
+                rarest = posting
+        return rarest
+
+    def search_positions(self, query: str) -> Iterator[int]:
+        """Find positions of songs whose key contains a normalised query, in library order"""
+        if query == "":
+            yield from range(len(self.songs))
+            return
+        candidates = self.get_candidates(query)
+        if len(query) <= self.gram_size:
+            # The posting list is exact for short queries
+            yield from candidates
+        else:
+            keys = self.keys
+            for position in candidates:
+                if query in keys[position]:
+                    yield position
+
+    def search(self, substr: str) -> Iterator:
+        """
+        Find songs whose key contains a substring, in library order.
+        Matches are identical to a linear `substr in str(song).lower()` scan
+        """
+        for position in self.search_positions(self.normalise(substr)):
+            yield self.songs[position]
+
+    def search_prefix_positions(self, query: str) -> Iterator[int]:
+        """Find positions of songs whose artist or title starts with a normalised query"""
+        keys = self.keys
+        title_offsets = self.title_offsets
+        for position in self.get_candidates(query, self.prefix_postings):
+            key = keys[position]
+            if key.startswith(query) or key.startswith(query, title_offsets[position]):
+                yield position
+
+    def search_boundary_positions(self, query: str) -> Iterator[int]:
+        """Find positions of songs with a normalised query starting a word"""
+        keys = self.keys
+        for position in self.get_candidates(query, self.boundary_postings):
+            key = keys[position]
+            start = key.find(query)
+            while start != -1:
+                if self.is_boundary(key, start):
+                    yield position
+                    break
+                start = key.find(query, start + 1)
+
+    def score(self, position: int, query: str) -> int:
+        """
+        Score how well a matching song fits a normalised query (lower is better):
+        0 for an exact artist/title match, 1 for an artist/title prefix,
+        2 for a match at a word boundary, 3 for any other substring
+        """
+        key = self.keys[position]
+        title_offset = self.title_offsets[position]
+        if query == key or query == key[title_offset:] or query == key[:title_offset - 2]:
+            return 0
+        if key.startswith(query) or key.startswith(query, title_offset):
+            return 1
+        start = key.find(query)
+        while start != -1:
+            if self.is_boundary(key, start):
+                return 2
+            start = key.find(query, start + 1)
+        return 3
+
+    def rank_positions(self, query: str, k: int, candidates: Iterable[int] | None = None) -> list[int]:
+        """
+        Get positions of the best k matches for a normalised query, best first and then in library order.
+        Exact artist/title matches come first, then artist/title prefixes,
+        then matches at a word boundary and finally any other substring.
+        If `candidates` (a superset of matching positions) is given, only those are considered
+        """
+        if k <= 0:
+            return []
+        if candidates is not None:
+            # Bounded heap of the k best (score, position) pairs
+            keys = self.keys
+            return heapq.nsmallest(
+                k,
+                (position for position in candidates if query in keys[position]),
+                key=lambda position: (self.score(position, query), position)
+            )
+        if query == "":
+            return list(range(min(k, len(self.songs))))
+        tiers = itertools.chain(
+            self.exact.get(query, array('I')),
+            self.search_prefix_positions(query),
+            self.search_boundary_positions(query),
+            self.search_positions(query)
+        )
+        # Each tier is in library order and the worse tiers contain the better
+        # ones, so only the first k distinct positions are ever generated
+        top = []
+        seen = set()
+        for position in tiers:
+            if position not in seen:
+                seen.add(position)
+                top.append(position)
+                if len(top) == k:
+                    break
+        return top
+
+    def rank(self, substr: str, k: int) -> list:
+        """Get the best k songs matching a substring, best first"""
+        return [self.songs[position] for position in self.rank_positions(self.normalise(substr), k)]
@@ -0,0 +1,212 @@
+import json
+import logging
+import os
+import shutil
+import threading
+from .process_song import Song, ClipGenerator, SongUnavailable
+from .metrics import metrics
+
+class SongPipeline:
+    """
+    Prepare upcoming songs in a background thread.
+    Each song is downloaded and clipped into its own directory under `clip_root`,
+    and only marked as prepared once all its clips exist, so launching a game
+    just picks up the oldest prepared song. Prepared songs survive restarts
+    """
+    marker_file = 'song.json'
+    # Songs tried when one has to be prepared on the spot
+    max_attempts = 3
+
+    def __init__(self, library, clip_root='song_clips', queue_depth=2, disk_budget=None, poll_interval=10, clip_cache=None, profile='mp3', rotation=None) -> None:
+        self.library = library
+        # Chooses upcoming songs; without it they are picked at random
+        self.rotation = rotation
+        # Songs played before are copied from here instead of downloaded again
+        self.clip_cache = clip_cache
+        self.profile = profile
+        self.clip_root = clip_root
+        # Number of prepared songs to keep ready, not counting the ones being played
+        self.queue_depth = queue_depth
+        # Stop preparing songs while clip_root uses more than this many bytes
+        self.disk_budget = disk_budget
+        self.poll_interval = poll_interval
+        # Songs being played or prepared, which must not be picked again or deleted
+        self.in_use: set[str] = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        os.makedirs(self.clip_root, exist_ok=True)
+        self.remove_incomplete()
+
+    def remove_incomplete(self) -> None:
+        """Delete song directories left half-prepared by an earlier run"""
+        for song_id in os.listdir(self.clip_root):
+            song_dir = self.get_song_dir(song_id)
+            if not os.path.exists(os.path.join(song_dir, self.marker_file)):
+                logging.info(f"Removing incomplete song directory {song_dir}")
+                if os.path.isdir(song_dir):
+                    shutil.rmtree(song_dir, ignore_errors=True)
+                else:
+                    os.remove(song_dir)
+
+    def get_song_dir(self, song_id) -> str:
+        """Get the directory for one song's clips"""
+        return os.path.join(self.clip_root, song_id)
+
+    def list_prepared(self) -> list[str]:
+        """Get IDs of prepared songs waiting to be played, oldest first"""
+        prepared = []
+        for song_id in os.listdir(self.clip_root):
+            marker = os.path.join(self.get_song_dir(song_id), self.marker_file)
+            if song_id not in self.in_use and os.path.exists(marker):
+                prepared.append((os.path.getmtime(marker), song_id))
+        return [song_id for (_, song_id) in sorted(prepared)]
+
+    def get_disk_usage(self) -> int:
+        """Get the total size of all song directories in bytes"""
+        total = 0
+        for dir_path, _, filenames in os.walk(self.clip_root):
+            for filename in filenames:
+                total += os.path.getsize(os.path.join(dir_path, filename))
+        return total
+
+    def has_room(self) -> bool:
+        """Check whether another song should be prepared"""
+        if len(self.list_prepared()) >= self.queue_depth:
+            return False
+        return self.disk_budget is None or self.get_disk_usage() < self.disk_budget
+
+    def pick_song(self) -> Song:
+        """
+        Pick the next planned (or a random) song that isn't already prepared,
+        being prepared or playing, and reserve it until it is released
+        """
+        with self.lock:
+            taken = set(os.listdir(self.clip_root)) | self.in_use
+            song = None
+            if self.rotation is not None:
+                for song_id in self.rotation.plan(len(taken) + 1):
+                    if song_id not in taken:
+                        song = self.library.songs[song_id]
+                        break
+            if song is None:
+                song = self.library.get_random_song()
+                for _ in range(10):
+                    if song.get_id() not in taken:
+                        break
+                    song = self.library.get_random_song()
+            self.in_use.add(song.get_id())
+        return song
+
+    @metrics.timed('prepare_song')
+    def prepare_song(self, song) -> None:
+        """Download and clip one song into its directory, then mark it prepared"""
+        song_dir = self.get_song_dir(song.get_id())
+        logging.info(f"Preparing {song} in {song_dir}")
+        try:
+            ClipGenerator(song_dir, clip_cache=self.clip_cache, profile=self.profile).prepare_song(song)
+        except SongUnavailable:
+            logging.exception(f"Failed to prepare {song}")
+            shutil.rmtree(song_dir, ignore_errors=True)
+            # Otherwise the same planned song would be picked (and fail) again
+            if self.rotation is not None:
+                self.rotation.record_failure(song.get_id())
+            raise
+        except Exception:
+            # e.g. a network error, so the song is tried again later
+            logging.exception(f"Failed to prepare {song}")
+            shutil.rmtree(song_dir, ignore_errors=True)
+            raise
+        if self.rotation is not None:
+            self.rotation.record_success(song.get_id())
+        song_info = {
+            'videoId': song.get_id(),
+            'title': song.get_title(),
+            'artists': [{'name': song.get_artist()}],
+            # Clips are loaded in this format even if --clip-profile changes before they are played
+            'profile': self.profile
+        }
+        marker = os.path.join(song_dir, self.marker_file)
+        with open(marker + '.tmp', 'w') as marker_fh:
+            json.dump(song_info, marker_fh)
+        os.replace(marker + '.tmp', marker)
+        logging.info(f"Prepared {song}")
+
+    def load_prepared(self, song_id) -> tuple[Song, ClipGenerator]:
+        """Load a prepared song without touching its clips, in the format they were prepared in"""
+        song_dir = self.get_song_dir(song_id)
+        with open(os.path.join(song_dir, self.marker_file)) as marker_fh:
+            song_info = json.load(marker_fh)
+        # Songs prepared before the profile was recorded are MP3
+        return Song(song_info), ClipGenerator(song_dir, clean=False, profile=song_info.get('profile', 'mp3'))
+
+    def take_next(self) -> tuple[Song, ClipGenerator]:
+        """Get the next prepared song to play, preparing one now if none is ready"""
+        with self.lock:
+            prepared = self.list_prepared()
+            song_id = prepared[0] if prepared else None
+            if song_id is not None:
+                self.in_use.add(song_id)
+        if song_id is None:
+            logging.info("No prepared song available, preparing one now")
+            for attempt in range(self.max_attempts):
+                song = self.pick_song()
+                try:
+                    self.prepare_song(song)
+                    break
+                except Exception:
+                    with self.lock:
+                        self.in_use.discard(song.get_id())
+                    if attempt == self.max_attempts - 1:
+                        raise
+            song_id = song.get_id()
+        song, clip_generator = self.load_prepared(song_id)
+        logging.info(f"Chosen song: {song}")
+        if self.rotation is not None:
+            self.rotation.record(song)
+        return song, clip_generator
+
+    def resume(self, song_id) -> tuple[Song, ClipGenerator] | None:
+        """Take a song that was being played before a restart, if its clips are still there"""
+        if not os.path.exists(os.path.join(self.get_song_dir(song_id), self.marker_file)):
+            return None
+        with self.lock:
+            self.in_use.add(song_id)
+        return self.load_prepared(song_id)
+
+    def release(self, song) -> None:
+        """Delete a played song's clips"""
+        logging.info(f"Removing clips for {song}")
+        shutil.rmtree(self.get_song_dir(song.get_id()), ignore_errors=True)
+        with self.lock:
+            self.in_use.discard(song.get_id())
+
+    def run(self) -> None:
+        """Keep preparing songs until stopped"""
+        while not self.stop_event.is_set():
+            if self.has_room():
+                song = self.pick_song()
+                try:
+                    self.prepare_song(song)
+                except Exception:
+                    # Already logged; try another song after a pause
+                    self.stop_event.wait(self.poll_interval)
+                finally:
+                    # Prepared songs are handed out by take_next from now on
+                    with self.lock:
+                        self.in_use.discard(song.get_id())
+            else:
+                self.stop_event.wait(self.poll_interval)
+
+    def start(self) -> None:
+        """Start preparing songs in a background thread"""
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="song-pipeline", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None) -> None:
+        """Stop the background thread after the song it is preparing"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
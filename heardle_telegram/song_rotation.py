@@ -0,0 +1,209 @@
+import logging
+import random
+import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from collections import Counter
+from itertools import accumulate
+from .process_song import Song
+
+class SongRotation:
+    """
+    Chooses the songs for upcoming games from the library.
+    Plays are kept in SQLite, and a song (or another song by the same artist)
+    isn't picked again until a number of other games have been played.
+    Songs are drawn from a list (or cumulative weights) precomputed when the
+    rotation loads and after each play, so each draw is O(1) (or O(log n)).
+    Upcoming picks are planned ahead and kept, so songs prepared in advance
+    are the ones that get played, and plans are reproducible from the seed.
+    Songs that are unavailable or undecodable several times in a row are
+    skipped, and not planned again until the skip expires
+    """
+    weightings = ('uniform', 'plays', 'recency')
+    # Random draws tried before falling back to scanning for an allowed song
+    max_attempts = 100
+
+    def __init__(self, library, path='play_history.db', song_window=365, artist_window=3, weighting='uniform', recency_horizon=365, seed=0, max_failures=3, skip_days=30) -> None:
+        self.library = library
+        self.path = path
+        # Number of games before the same song (or artist) can come up again
+        self.song_window = song_window
+        self.artist_window = artist_window
+        # 'plays' favours songs played fewer times, 'recency' songs not played for longer
+        self.weighting = weighting
+        self.recency_horizon = recency_horizon
+        self.seed = seed
+        # Consecutive failures before a song is skipped, and how long it stays skipped
+        self.max_failures = max_failures
+        self.skip_seconds = skip_days * 86400
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS plays (play_number INTEGER PRIMARY KEY, song_id TEXT, played_at REAL)"
+        )
+        self.connection.execute("CREATE TABLE IF NOT EXISTS plan (position INTEGER PRIMARY KEY, song_id TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS skipped (song_id TEXT PRIMARY KEY, skipped_at REAL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS failures (song_id TEXT PRIMARY KEY, failures INTEGER)")
+        self.song_ids = list(library.songs)
+        self.play_count = 0
+        self.song_plays: Counter[str] = Counter()
+        self.song_last_played: dict[str, int] = {}
+        self.artist_last_played: dict[int, int] = {}
+        for (play_number, song_id) in self.connection.execute("SELECT play_number, song_id FROM plays ORDER BY play_number"):
+            self.apply_play(song_id, play_number)
+        self.skipped = dict(self.connection.execute("SELECT song_id, skipped_at FROM skipped"))
+        self.failures = dict(self.connection.execute("SELECT song_id, failures FROM failures"))
+        self.planned = [
+            song_id for (song_id,) in self.connection.execute("SELECT song_id FROM plan ORDER BY position")
+            if song_id in library.songs
+        ]
+        self.build_weights()
+        logging.info(
+            f"Loaded {self.play_count} plays, {len(self.planned)} planned songs "
+            f"and {len(self.skipped)} skipped songs from {path}"
+        )
+
+    def get_artist_key(self, song_id) -> int:
+        """Get the canonical artist of a song, so different spellings share a window"""
+        return self.library.answer_keys.get_keys(self.library.songs[song_id])[0]
+
+    def apply_play(self, song_id, play_number) -> None:
+        """Update play counts and last-played positions for one play"""
+        self.play_count = play_number + 1
+        self.song_plays[song_id] += 1
+        self.song_last_played[song_id] = play_number
+        if song_id in self.library.songs:
+            self.artist_last_played[self.get_artist_key(song_id)] = play_number
+
+    def build_weights(self) -> None:
+        """Precompute the cumulative weights songs are drawn by"""
+        if self.weighting == 'plays':
+            weights = (1 / (1 + self.song_plays[song_id]) for song_id in self.song_ids)
+        elif self.weighting == 'recency':
+            weights = (
+                min(self.play_count - self.song_last_played.get(song_id, -self.recency_horizon), self.recency_horizon) / self.recency_horizon
+                for song_id in self.song_ids
+            )
+        else:
+            self.cumulative_weights = None
+            return
+        self.cumulative_weights = list(accumulate(weights))
+
+    def draw(self, rng: random.Random) -> str:
+        """Draw one song ID, ignoring repeat windows"""
+        if self.cumulative_weights is None or self.cumulative_weights[-1] <= 0:
+            return self.song_ids[rng.randrange(len(self.song_ids))]
+        position = bisect_right(self.cumulative_weights, rng.random() * self.cumulative_weights[-1])
+        return self.song_ids[min(position, len(self.song_ids) - 1)]
+
+    def is_skipped(self, song_id) -> bool:
+        """Check whether a song is skipped and the skip hasn't expired"""
+        skipped_at = self.skipped.get(song_id)
+        return skipped_at is not None and time.time() - skipped_at < self.skip_seconds
+
+    def is_allowed(self, song_id, play_number, planned_songs: dict, planned_artists: dict) -> bool:
+        """Check whether a song is outside the repeat windows for a (future) play, and not skipped"""
+        if self.is_skipped(song_id):
+            return False
+        last_played = planned_songs.get(song_id, self.song_last_played.get(song_id))
+        if last_played is not None and play_number - last_played < self.song_window:
+            return False
+        artist_key = self.get_artist_key(song_id)
+        last_played = planned_artists.get(artist_key, self.artist_last_played.get(artist_key))
+        return last_played is None or play_number - last_played >= self.artist_window
+
+    def pick(self, play_number, planned_songs: dict, planned_artists: dict) -> str:
+        """Pick the song for a (future) play, seeded by its play number"""
+        rng = random.Random(f"{self.seed}:{play_number}")
+        for _ in range(self.max_attempts):
+            song_id = self.draw(rng)
+            if self.is_allowed(song_id, play_number, planned_songs, planned_artists):
+                return song_id
+        # Most songs are inside a window (e.g. a small library), so look at all of them
+        allowed = [song_id for song_id in self.song_ids if self.is_allowed(song_id, play_number, planned_songs, planned_artists)]
+        if allowed:
+            return rng.choice(allowed)
+        logging.warning("Every song is inside a repeat window, picking the least recently played one")
+        candidates = [song_id for song_id in self.song_ids if not self.is_skipped(song_id)] or self.song_ids
+        return min(candidates, key=lambda song_id: planned_songs.get(song_id, self.song_last_played.get(song_id, -1)))
+
+    def plan(self, count) -> list[str]:
+        """Get the IDs of the next `count` songs to play, planning more if needed"""
+        with self.lock:
+            if len(self.planned) < count:
+                planned_songs = {}
+                planned_artists = {}
+                for offset, song_id in enumerate(self.planned):
+                    planned_songs[song_id] = self.play_count + offset
+                    planned_artists[self.get_artist_key(song_id)] = self.play_count + offset
+                while len(self.planned) < count:
+                    play_number = self.play_count + len(self.planned)
+                    song_id = self.pick(play_number, planned_songs, planned_artists)
+                    self.planned.append(song_id)
+                    planned_songs[song_id] = play_number
+                    planned_artists[self.get_artist_key(song_id)] = play_number
+                self.write_plan()
+            return self.planned[:count]
+
+    def record_failure(self, song_id) -> None:
+        """
+        Count a failure to prepare an unavailable or undecodable song, and after
+        enough in a row drop it from the plan until the skip expires
+        """
+        with self.lock:
+            failures = self.failures.get(song_id, 0) + 1
+            skip = failures >= self.max_failures
+            with self.connection:
+                self.connection.execute("BEGIN")
+                if skip:
+                    self.connection.execute("DELETE FROM failures WHERE song_id = ?", (song_id,))
+                    self.connection.execute("INSERT OR REPLACE INTO skipped VALUES (?, ?)", (song_id, time.time()))
+                else:
+                    self.connection.execute("INSERT OR REPLACE INTO failures VALUES (?, ?)", (song_id, failures))
+            if skip:
+                self.failures.pop(song_id, None)
+                self.skipped[song_id] = time.time()
+                if song_id in self.planned:
+                    self.planned.remove(song_id)
+                    self.write_plan()
+            else:
+                self.failures[song_id] = failures
+        if skip:
+            logging.info(f"Skipped {song_id} in the rotation after {failures} failures")
+        else:
+            logging.info(f"Recorded failure {failures} of {self.max_failures} for {song_id}")
+
+    def record_success(self, song_id) -> None:
+        """Clear a prepared song's failures, so only failures in a row lead to a skip"""
+        with self.lock:
+            if song_id not in self.failures and song_id not in self.skipped:
+                return
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.execute("DELETE FROM failures WHERE song_id = ?", (song_id,))
+                self.connection.execute("DELETE FROM skipped WHERE song_id = ?", (song_id,))
+            self.failures.pop(song_id, None)
+            self.skipped.pop(song_id, None)
+
+    def write_plan(self) -> None:
+        """Persist the planned songs"""
+        with self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.execute("DELETE FROM plan")
+            self.connection.executemany("INSERT INTO plan VALUES (?, ?)", enumerate(self.planned))
+
+    def record(self, song: Song) -> None:
+        """Record that a song is being played"""
+        with self.lock:
+            play_number = self.play_count
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.execute("INSERT INTO plays VALUES (?, ?, ?)", (play_number, song.get_id(), time.time()))
+            self.apply_play(song.get_id(), play_number)
+            if song.get_id() in self.planned:
+                self.planned.remove(song.get_id())
+                self.write_plan()
+            self.build_weights()
+        logging.info(f"Recorded play #{play_number} of {song}")
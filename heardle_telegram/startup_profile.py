@@ -0,0 +1,51 @@
+import sys
+import time
+from prettytable import PrettyTable
+from .metrics import Metrics
+
+class StartupProfile:
+    """
+    Time taken by each phase of starting the bot, for --profile-startup.
+    Phases are timed back to back from the start of the script. Clip preparation
+    only happens during startup when no song was prepared in advance, and is
+    read from the song preparation metrics. Also lists which of the heavy
+    modules were loaded, since serving a prepared game needs none of the
+    download and audio stack
+    """
+    heavy_modules = ['telegram.ext', 'ytmusicapi', 'youtube_dl', 'pydub', 'numpy']
+    clip_stages = ['prepare_song', 'prepare_download', 'prepare_silence', 'prepare_encode']
+
+    def __init__(self, start_time: float) -> None:
+        self.start_time = start_time
+        self.last_mark = start_time
+        self.phases: dict[str, float] = {}
+
+    def mark(self, phase) -> None:
+        """End a phase, timing it from the end of the previous one"""
+        now = time.perf_counter()
+        self.phases[phase] = now - self.last_mark
+        self.last_mark = now
+
+    def get_loaded_modules(self) -> list[str]:
+        """Get the heavy modules imported so far"""
+        return [name for name in self.heavy_modules if name in sys.modules]
+
+    def show(self, metrics: Metrics) -> str:
+        """Display time per phase, with clip preparation broken down by stage"""
+        report = PrettyTable()
+        report.field_names = ["Phase", "Seconds"]
+        report.align["Phase"] = 'l'
+        report.align["Seconds"] = 'r'
+        histograms = metrics.get_snapshot()['histograms']
+        for phase, seconds in self.phases.items():
+            report.add_row([phase, f"{seconds:.3f}"])
+            if phase != 'game':
+                continue
+            for stage in self.clip_stages:
+                summary = histograms.get(stage)
+                if summary is not None and summary['count']:
+                    label = "  clip preparation" if stage == 'prepare_song' else f"    {stage.removeprefix('prepare_')}"
+                    report.add_row([label, f"{summary['mean'] * summary['count']:.3f}"])
+        report.add_row(["total", f"{self.last_mark - self.start_time:.3f}"])
+        loaded = self.get_loaded_modules()
+        return f"{report.get_string()}\nHeavy modules loaded: {', '.join(loaded) if loaded else 'none'}"
@@ -0,0 +1,120 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from prettytable import PrettyTable
+
+class StatsStore:
+    """
+    Players' results across games, kept in SQLite.
+    Every final score is appended to a results table, and the player's
+    aggregates (games played, wins, guess distribution, streaks) are updated
+    in the same transaction, so stats and rankings are read from the aggregates
+    without going through the history. A result is only counted once per game,
+    so recording it again (e.g. after a restart) changes nothing
+    """
+    max_guesses = 6
+
+    def __init__(self, path='stats.db') -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "game_id TEXT, user_id INTEGER, score INTEGER, finished_at REAL, "
+            "PRIMARY KEY (game_id, user_id))"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS user_stats ("
+            "user_id INTEGER PRIMARY KEY, username TEXT, played INTEGER, wins INTEGER, "
+            "total_guesses INTEGER, distribution TEXT, current_streak INTEGER, max_streak INTEGER, "
+            "last_played REAL)"
+        )
+        # All-time ranking: most wins, then fewest guesses in total
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS user_stats_rank ON user_stats (wins DESC, total_guesses ASC)"
+        )
+
+    def record_result(self, game_id, user_id, username, score) -> bool:
+        """Add a player's final score (7 for a loss), returning False if it was already recorded"""
+        won = score <= self.max_guesses
+        with self.lock, self.connection:
+            self.connection.execute("BEGIN")
+            inserted = self.connection.execute(
+                "INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?)", (game_id, user_id, score, time.time())
+            ).rowcount
+            if not inserted:
+                return False
+            row = self.connection.execute("SELECT * FROM user_stats WHERE user_id = ?", (user_id,)).fetchone()
+            stats = dict(row) if row is not None else {
+                'played': 0, 'wins': 0, 'total_guesses': 0,
+                'distribution': json.dumps([0] * (self.max_guesses + 1)),
+                'current_streak': 0, 'max_streak': 0
+            }
+            # Counts of games won in 1..6 guesses, then games lost
+            distribution = json.loads(stats['distribution'])
+            distribution[min(score, self.max_guesses + 1) - 1] += 1
+            current_streak = stats['current_streak'] + 1 if won else 0
+            self.connection.execute(
+                "INSERT OR REPLACE INTO user_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    user_id, username, stats['played'] + 1, stats['wins'] + won,
+                    stats['total_guesses'] + score, json.dumps(distribution),
+                    current_streak, max(stats['max_streak'], current_streak), time.time()
+                )
+            )
+        logging.info(f"Recorded score {score} for {username} [{user_id}] in game {game_id}")
+        return True
+
+    def get_user_stats(self, user_id) -> dict | None:
+        """Get a player's aggregates, or None if they haven't finished a game"""
+        with self.lock:
+            row = self.connection.execute("SELECT * FROM user_stats WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        stats = dict(row)
+        stats['distribution'] = json.loads(stats['distribution'])
+        stats['average_guesses'] = stats['total_guesses'] / stats['played']
+        return stats
+
+    def get_top(self, limit=10) -> list[dict]:
+        """Get the best players of all time"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT user_id, username, played, wins, total_guesses, max_streak FROM user_stats "
+                "ORDER BY wins DESC, total_guesses ASC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def show_user_stats(self, user_id) -> str | None:
+        """Display a player's stats and guess distribution"""
+        stats = self.get_user_stats(user_id)
+        if stats is None:
+            return None
+        lines = [
+            f"Played: {stats['played']}",
+            f"Won: {stats['wins']} ({100 * stats['wins'] // stats['played']}%)",
+            f"Average guesses: {stats['average_guesses']:.2f}",
+            f"Current streak: {stats['current_streak']}",
+            f"Longest streak: {stats['max_streak']}",
+            ""
+        ]
+        most = max(stats['distribution']) or 1
+        for guesses, count in enumerate(stats['distribution'], start=1):
+            label = str(guesses) if guesses <= self.max_guesses else 'X'
+            lines.append(f"{label} {'#' * (12 * count // most)} {count}")
+        return '\n'.join(lines)
+
+    def show_top(self, limit=10) -> str:
+        """Display the all-time leaderboard"""
+        leaderboard = PrettyTable()
+        leaderboard.field_names = ["User", "Won", "Played", "Streak"]
+        for player in self.get_top(limit):
+            leaderboard.add_row([
+                player['username'] or str(player['user_id']),
+                player['wins'], player['played'], player['max_streak']
+            ])
+        return leaderboard.get_string()
@@ -0,0 +1,73 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+class SubscriberStore:
+    """
+    Chats subscribed to game notifications, kept in SQLite.
+    Membership is checked against an in-memory set; each change is its own
+    durable transaction, and a lock keeps concurrent handler threads from
+    losing each other's updates
+    """
+    def __init__(self, path='subscribers.db') -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        # Whether the database was created just now
+        self.is_new = not os.path.exists(path)
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS subscribers (chat_id INTEGER PRIMARY KEY, subscribed_at REAL)"
+        )
+        self.subscribers = {chat_id for (chat_id,) in self.connection.execute("SELECT chat_id FROM subscribers")}
+
+    def __contains__(self, chat_id) -> bool:
+        return chat_id in self.subscribers
+
+    def __len__(self) -> int:
+        return len(self.subscribers)
+
+    def get_subscribers(self) -> list[int]:
+        """Get all subscribed chat IDs"""
+        with self.lock:
+            return list(self.subscribers)
+
+    def add(self, chat_id) -> bool:
+        """Subscribe a chat, returning False if it was already subscribed"""
+        with self.lock:
+            if chat_id in self.subscribers:
+                return False
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.execute("INSERT INTO subscribers VALUES (?, ?)", (chat_id, time.time()))
+            self.subscribers.add(chat_id)
+            return True
+
+    def remove(self, chat_id) -> bool:
+        """Unsubscribe a chat, returning False if it wasn't subscribed"""
+        with self.lock:
+            if chat_id not in self.subscribers:
+                return False
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.execute("DELETE FROM subscribers WHERE chat_id = ?", (chat_id,))
+            self.subscribers.discard(chat_id)
+            return True
+
+    def import_subscribers(self, chat_ids) -> int:
+        """Add chats (e.g. from the old telegram_config.json list) in one transaction, returning how many were new"""
+        with self.lock:
+            new_ids = [chat_id for chat_id in set(chat_ids) if chat_id not in self.subscribers]
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.executemany(
+                    "INSERT INTO subscribers VALUES (?, ?)",
+                    ((chat_id, time.time()) for chat_id in new_ids)
+                )
+            self.subscribers.update(new_ids)
+        if new_ids:
+            logging.info(f"Imported {len(new_ids)} subscribers into {self.path}")
+        return len(new_ids)
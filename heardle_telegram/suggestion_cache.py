@@ -0,0 +1,99 @@
+import itertools
+import logging
+import threading
+from collections import OrderedDict
+from .process_song import Song
+
+class SuggestionCacheEntry:
+    """Cached suggestions for one normalised query"""
+    def __init__(self, ranked: list[int], k: int, positions: list[int] | None) -> None:
+        # Best k positions, best first
+        self.ranked = ranked
+        self.k = k
+        # All matching positions in library order, or None if there were too many to keep
+        self.positions = positions
+
+class SuggestionCache:
+    """
+    LRU cache of song suggestions in front of Library.get_song_suggestions.
+    As players type, each query usually extends the previous one, so a new query
+    is answered by filtering the match set of its longest cached prefix
+    instead of searching the whole library again
+    """
+    def __init__(self, library, max_entries=1024, max_candidates=2000) -> None:
+        self.library = library
+        self.max_entries = max_entries
+        # Match sets larger than this are not kept for refinement
+        self.max_candidates = max_candidates
+        self.entries: OrderedDict[str, SuggestionCacheEntry] = OrderedDict()
+        self.index = library.index
+        self.hits = 0
+        self.refinements = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def clear(self) -> None:
+        """Drop all cached suggestions"""
+        self.entries.clear()
+        self.index = self.library.index
+
+    def get_stats(self) -> dict[str, int]:
+        """Get cache counters"""
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'refinements': self.refinements,
+            'misses': self.misses
+        }
+
+    def find_prefix_entry(self, query: str) -> SuggestionCacheEntry | None:
+        """Find the cached entry with the longest prefix of a query that still has its match set"""
+        for end in range(len(query) - 1, 0, -1):
+            entry = self.entries.get(query[:end])
+            if entry is not None and entry.positions is not None:
+                self.entries.move_to_end(query[:end])
+                return entry
+        return None
+
+    def store(self, query: str, entry: SuggestionCacheEntry) -> None:
+        """Add an entry, evicting the least recently used ones"""
+        self.entries[query] = entry
+        self.entries.move_to_end(query)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get_song_suggestions(self, substr, max_results=10, offset=0) -> list[Song]:
+        """Same as Library.get_song_suggestions, but cached"""
+        # Update workers may look up suggestions for several players at once
+        with self.lock:
+            if self.library.index is not self.index:
+                # The library has been reloaded since these were cached
+                logging.info("Library reloaded, clearing suggestion cache")
+                self.clear()
+            index = self.index
+            query = index.normalise(substr)
+            entry = self.entries.get(query)
+            if entry is not None and (entry.k >= max_results or entry.positions is not None):
+                self.hits += 1
+                self.entries.move_to_end(query)
+                if entry.k < max_results:
+                    entry.ranked = index.rank_positions(query, max_results, entry.positions)
+                    entry.k = max_results
+                ranked = entry.ranked[:max_results]
+            else:
+                prefix_entry = self.find_prefix_entry(query)
+                if prefix_entry is not None:
+                    self.refinements += 1
+                    positions = [position for position in prefix_entry.positions if query in index.keys[position]]
+                    ranked = index.rank_positions(query, max_results, positions)
+                else:
+                    self.misses += 1
+                    positions = list(itertools.islice(index.search_positions(query), self.max_candidates + 1))
+                    if len(positions) > self.max_candidates:
+                        positions = None
+                        ranked = index.rank_positions(query, max_results)
+                    else:
+                        ranked = index.rank_positions(query, max_results, positions)
+                self.store(query, SuggestionCacheEntry(ranked, max_results, positions))
+        logging.info(f"Suggesting songs matching {query}")
+        return [index.songs[position] for position in ranked[offset:]]
@@ -0,0 +1,148 @@
+import logging
+import threading
+import time
+from queue import Queue, Full
+from typing import Callable
+from telegram import Update
+from telegram.ext import Dispatcher, Updater
+
+class ShardedDispatcher(Dispatcher):
+    """
+    Dispatcher that hands updates to a pool of worker threads instead of
+    handling them one at a time on its own thread. Updates are sharded by user
+    (or chat), so one player's updates are always handled in order by the same
+    worker while different players are handled in parallel.
+    Each worker has a bounded queue; when it is full the dispatcher thread waits,
+    which backs up the update queue fed by polling or the webhook server
+    """
+    def __init__(self, *args, shards=4, shard_queue_size=100, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.shard_queues = [Queue(maxsize=shard_queue_size) for _ in range(shards)]
+        self.shard_threads: list[threading.Thread] = []
+        self.stats_lock = threading.Lock()
+        self.processed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        # Highest number of updates seen waiting for any one worker
+        self.max_queued = 0
+        # Times (and total seconds) the dispatcher thread waited on a full worker queue
+        self.blocked = 0
+        self.blocked_time = 0.0
+        # Called with each update as it arrives, before it waits for a worker
+        self.ingest_listeners: list[Callable[[Update], None]] = []
+
+    def add_ingest_listener(self, listener: Callable[[Update], None]) -> None:
+        """Call `listener(update)` for each update as soon as it arrives"""
+        self.ingest_listeners.append(listener)
+
+    def get_shard(self, update: Update) -> int:
+        """Get the worker for an update, the same for all updates from a user"""
+        if update.effective_user is not None:
+            key = update.effective_user.id
+        elif update.effective_chat is not None:
+            key = update.effective_chat.id
+        else:
+            key = update.update_id
+        return key % len(self.shard_queues)
+
+    def process_update(self, update: object) -> None:
+        """Queue an update for its worker; anything else (e.g. errors) is handled here"""
+        if not isinstance(update, Update):
+            super().process_update(update)
+            return
+        for listener in self.ingest_listeners:
+            listener(update)
+        shard_queue = self.shard_queues[self.get_shard(update)]
+        item = (time.perf_counter(), update)
+        try:
+            shard_queue.put_nowait(item)
+        except Full:
+            wait_start = time.perf_counter()
+            shard_queue.put(item)
+            with self.stats_lock:
+                self.blocked += 1
+                self.blocked_time += time.perf_counter() - wait_start
+        with self.stats_lock:
+            self.max_queued = max(self.max_queued, shard_queue.qsize())
+
+    def run_shard(self, shard: int) -> None:
+        """Handle one worker's updates in order until stopped"""
+        shard_queue = self.shard_queues[shard]
+        while True:
+            item = shard_queue.get()
+            if item is None:
+                break
+            queued_at, update = item
+            try:
+                super().process_update(update)
+            except Exception:
+                # Handler errors are already sent to error handlers; this is a last resort
+                logging.exception(f"Failed to process update {update.update_id}")
+            latency = time.perf_counter() - queued_at
+            with self.stats_lock:
+                self.processed += 1
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+
+    def start(self, ready=None) -> None:
+        """Start the workers, then feed them from the update queue until stopped"""
+        self.shard_threads = [
+            threading.Thread(target=self.run_shard, args=(shard,), name=f"update-worker-{shard}", daemon=True)
+            for shard in range(len(self.shard_queues))
+        ]
+        for thread in self.shard_threads:
+            thread.start()
+        super().start(ready)
+
+    def stop(self) -> None:
+        """Stop taking updates, then let the workers finish the ones they have"""
+        super().stop()
+        for shard_queue in self.shard_queues:
+            shard_queue.put(None)
+        for thread in self.shard_threads:
+            thread.join()
+        self.shard_threads = []
+
+    def get_stats(self) -> dict:
+        """Get backlog, throughput and latency counters"""
+        with self.stats_lock:
+            return {
+                'backlog': self.update_queue.qsize(),
+                'queued': [shard_queue.qsize() for shard_queue in self.shard_queues],
+                'max_queued': self.max_queued,
+                'processed': self.processed,
+                'mean_latency_ms': round(1000 * self.total_latency / self.processed, 2) if self.processed else 0.0,
+                'max_latency_ms': round(1000 * self.max_latency, 2),
+                'blocked': self.blocked,
+                'blocked_seconds': round(self.blocked_time, 2)
+            }
+
+class WebhookUpdater(Updater):
+    """
+    Updater that can serve webhook updates without registering the webhook with
+    Telegram, e.g. to replay recorded updates locally. If the webhook server
+    fails to start (or registering it fails), the error is kept in
+    `webhook_error` instead of leaving startup waiting for a server that never runs
+    """
+    def __init__(self, *args, register_webhook=True, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.register_webhook = register_webhook
+        self.webhook_error: Exception | None = None
+
+    def _bootstrap(self, *args, webhook_url=None, **kwargs) -> None:
+        if webhook_url and not self.register_webhook:
+            logging.info("Not registering the webhook with Telegram")
+            return
+        super()._bootstrap(*args, webhook_url=webhook_url, **kwargs)
+
+    def _start_webhook(self, *args, ready=None, **kwargs) -> None:
+        try:
+            super()._start_webhook(*args, ready=ready, **kwargs)
+        except Exception as e:
+            # Not raised on, which would also stop the dispatcher from starting
+            logging.exception("Webhook server stopped")
+            self.webhook_error = e
+        finally:
+            # start_webhook waits for this even if the server never started
+            if ready is not None:
+                ready.set()
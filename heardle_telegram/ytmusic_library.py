@@ -2,35 +2,71 @@ import logging
 import os
 import json
 import random
-from ytmusicapi import YTMusic
+import time
 from .process_song import Song
+from .song_index import SongIndex
+from .library_snapshot import LibrarySnapshot
+from .library_sync import LibrarySync, YTMusicPager
+from .answer_keys import AnswerKeys
 
 class Library:
-    def __init__(self, force_update=False, cache='library_cache') -> None:
+    def __init__(self, force_update=False, cache='library_cache', snapshot=None, additions_only=False, aliases=None) -> None:
         self.songs = dict()
+        self.index = SongIndex([])
+        # Optional table of other names for artists and titles, used when checking guesses
+        self.aliases = AnswerKeys.read_aliases(aliases) if aliases is not None else None
+        self.answer_keys = AnswerKeys([])
         self.cache = cache
+        # Optional SQLite snapshot that loads much faster than the JSON Lines cache
+        self.snapshot = LibrarySnapshot(snapshot) if snapshot is not None else None
         if force_update:
-            self.update_cache()
+            self.update_cache(additions_only=additions_only)
+            if self.snapshot is not None:
+                self.read_cache()
+                self.write_snapshot()
         else:
             self.check_update_cache()
 
     def check_update_cache(self) -> None:
-        """Update cache if it's non-existent/empty and load it"""
+        """Update cache if it's non-existent/empty and load it, preferring an up-to-date snapshot"""
+        if self.snapshot is not None and self.snapshot.is_newer_than(self.cache) and self.read_snapshot():
+            return
         if not os.path.exists(self.cache) or os.stat(self.cache).st_size == 0:
             self.update_cache()
         self.read_cache()
+        if self.snapshot is not None:
+            self.write_snapshot()
+
+    def read_snapshot(self) -> bool:
+        """Load songs and index from the snapshot, returning whether it was usable"""
+        start_time = time.perf_counter()
+        if not self.snapshot.open():
+            return False
+        self.songs, self.index, keys = self.snapshot.read()
+        logging.info(f"Read {len(self.songs)} songs from snapshot {self.snapshot.path} in {time.perf_counter() - start_time:.2f} s")
+        # Keys saved with other aliases (or older normalisation) are computed again
+        if self.snapshot.meta.get('answer_keys') == AnswerKeys.get_fingerprint(self.aliases):
+            self.answer_keys = AnswerKeys.from_keys(keys, self.aliases, self.snapshot.read_answer_key_ids)
+        else:
+            self.build_answer_keys()
+        return True
+
+    def write_snapshot(self) -> None:
+        """Write the loaded songs and index to the snapshot"""
+        self.snapshot.write(list(self.songs.values()), self.index, self.answer_keys, AnswerKeys.get_fingerprint(self.aliases))
 
-    def update_cache(self) -> None:
+    def update_cache(self, additions_only=False) -> None:
         """Update cache of songs from YTMusic"""
         logging.info("Updating cache from YTMusic")
+        # Only needed to sync, so not loaded when serving from the cache
+        from ytmusicapi import YTMusic
         # Authenticate
-        ytmusic = YTMusic('headers_auth.json')
-        songs = ytmusic.get_library_songs(limit=999999)
-        with open(self.cache, 'w') as cache_fh:
-            for song in songs:
-                json.dump(song, cache_fh)
-                cache_fh.write('\n')
-        logging.info(f"Wrote {len(songs)} songs to cache")
+        pager = YTMusicPager(YTMusic('headers_auth.json'))
+        library_sync = LibrarySync(self.cache)
+        if additions_only:
+            library_sync.sync_additions(pager)
+        else:
+            library_sync.sync(pager)
 
     def read_cache(self) -> list:
         """Read song list from cache"""
@@ -41,6 +77,20 @@ class Library:
                 song_entry = json.loads(line)
                 self.songs[song_entry['videoId']] = Song(song_entry)
         logging.info(f"Read {len(self.songs)} songs from cache")
+        self.build_index()
+
+    def build_index(self) -> None:
+        """Build the autocomplete index over the loaded songs"""
+        start_time = time.perf_counter()
+        self.index = SongIndex(self.songs.values())
+        logging.info(f"Built song index in {time.perf_counter() - start_time:.2f} s")
+        self.build_answer_keys()
+
+    def build_answer_keys(self) -> None:
+        """Compute the keys guesses are checked by for the loaded songs"""
+        start_time = time.perf_counter()
+        self.answer_keys = AnswerKeys(self.songs.values(), self.aliases)
+        logging.info(f"Built answer keys in {time.perf_counter() - start_time:.2f} s")
 
     def get_artist_by_song_id(self, id) -> str:
         """Get artist for a specific song ID"""
@@ -56,18 +106,15 @@ class Library:
 
     def get_random_song(self) -> Song:
         """Get a random song"""
-        song = random.choice(list(self.songs.values()))
+        song = random.choice(self.index.songs)
         logging.info(f"Chosen song: {song}")
         return song
 
-    def get_song_suggestions(self, substr, max_results=10):
-        """Find songs (artist + title) matching a substring"""
-        n_results = 0
+    def get_song_suggestions(self, substr, max_results=10, offset=0) -> list[Song]:
+        """
+        Find songs (artist + title) matching a substring, best matches first.
+        Returns the ranked matches from `offset` up to `max_results`
+        """
         substr = substr.lower()
         logging.info(f"Suggesting songs matching {substr}")
-        for (_, song) in self.songs.items():
-            if substr in str(song).lower():
-                n_results += 1
-                yield song
-                if n_results >= max_results:
-                    break
+        return self.index.rank(substr, max_results)[offset:]
@@ -4,7 +4,8 @@ from heardle_telegram.ytmusic_library import Library
 
 def parse_args() -> argparse.Namespace:
     arg_parser = argparse.ArgumentParser(
-        description="Update library and write to file for heardle-telegram",
+        description="Update library and write to file for heardle-telegram. "
+                    "An interrupted update resumes where it stopped when run again",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
         add_help=True
     )
@@ -13,6 +14,16 @@ def parse_args() -> argparse.Namespace:
         default='library_cache',
         help="File to write list of songs to"
     )
+    arg_parser.add_argument(
+        "--snapshot",
+        default='library.db',
+        help="File to write an indexed snapshot of the library to, for fast startup"
+    )
+    arg_parser.add_argument(
+        "--additions-only",
+        action='store_true',
+        help="Only fetch songs added since the last update, instead of syncing the whole library"
+    )
     return arg_parser.parse_args()
 
 if __name__ == '__main__':
@@ -22,4 +33,9 @@ if __name__ == '__main__':
         level=logging.INFO
     )
     options = parse_args()
-    _ = Library(force_update=True, cache=options.cache)
+    _ = Library(
+        force_update=True,
+        cache=options.cache,
+        snapshot=options.snapshot,
+        additions_only=options.additions_only
+    )